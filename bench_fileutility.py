@@ -0,0 +1,605 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+import argparse
+import asyncio
+import datetime
+import math
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+
+import fileutility
+from benchmarks import generator
+
+
+""" bench_fileutility.py
+Benchmarks for fileutility.py.
+Builds a synthetic file tree (or reuses one given with --root) and times the requested benchmark against it.
+
+python bench_fileutility.py walk --files 1000000
+"""
+
+
+def make_tree(root, files, files_per_directory=1000, breadth=10):
+    """ Builds a tree of files files without dates in their names at root with benchmarks.generator and returns root.
+        The directories are nested breadth wide, deep enough for about files_per_directory files in each.
+        A tree built from the same spec is reused, creating a million files takes a while.
+    """
+    depth = max(0, int(round(math.log(max(1.0, files / float(files_per_directory)), breadth))))
+    return generator.make_tree(root, generator.TreeSpec(files=files, breadth=breadth, depth=depth, dated=0))
+
+
+def make_archive(root, years=10, files_per_day=2, start='2009-01-01'):
+    """ Builds a tree at root holding only dated files, kept in archive/yyyy/mm/dd and files_per_day a day on average over
+        years years from start, and returns the archive directory. A tree built from the same spec is reused.
+    """
+    days = years * 365
+    spec = generator.TreeSpec(files=days * files_per_day, depth=0, dated=1.0, archive=True, date_start=start, date_days=days)
+    return os.path.join(generator.make_tree(root, spec), 'archive')
+
+
+def legacy_do_scan(start_dir, recursion_depth=-1, depth=0):
+    """ The os.listdir based scan find_files used before the os.scandir walker, kept for comparison. """
+    scan = [os.path.join(start_dir, x) for x in os.listdir(start_dir)]
+    found_files = [x for x in scan if os.path.isfile(x)]
+
+    if recursion_depth == -1 or depth < recursion_depth:
+        [found_files.extend(legacy_do_scan(x, recursion_depth, depth+1)) for x in scan if os.path.isdir(x)]
+    return found_files
+
+
+def legacy_filter_files(files, file_suffix, minimum_file_age, maximum_file_age):
+    """ The list based _filter_files with its membership re-filtering, kept for comparison. Takes plain paths. """
+    if file_suffix:
+        suffix = [x for x in files if x.endswith(file_suffix)]
+        files = [x for x in files if x in suffix]
+    if minimum_file_age:
+        minage = [x for x in files if datetime.datetime.fromtimestamp(os.path.getmtime(x)) <= minimum_file_age]
+        files = [x for x in files if x in minage]
+    if maximum_file_age:
+        maxage = [x for x in files if datetime.datetime.fromtimestamp(os.path.getmtime(x)) >= maximum_file_age]
+        files = [x for x in files if x in maxage]
+    return files
+
+
+class FakeStat(object):
+    __slots__ = ('st_mtime', 'st_size')
+
+    def __init__(self, st_mtime, st_size=0):
+        self.st_mtime = st_mtime
+        self.st_size = st_size
+
+
+class FakeEntry(object):
+    """ Stands in for os.DirEntry so the filters can be timed without touching the disk. """
+    __slots__ = ('name', 'path', '_stat')
+
+    def __init__(self, directory, name, st_mtime):
+        self.name = name
+        self.path = os.path.join(directory, name)
+        self._stat = FakeStat(st_mtime)
+
+    def stat(self):
+        return self._stat
+
+
+def fake_entries(count, start=datetime.datetime(2015, 1, 1)):
+    """ count in memory entries spread over 100 directories, every other one a .log, with one mtime per minute from start.
+        The name of each entry carries the date of its mtime.
+    """
+    base = time.mktime(start.timetuple())
+    return [
+        FakeEntry(
+            '/data/d{d}'.format(d=n % 100),
+            'app-{date:%Y-%m-%d}.{n}{suffix}'.format(n=n, date=start + datetime.timedelta(minutes=n), suffix='.log' if n % 2 else '.txt'),
+            base + n * 60)
+        for n in range(count)
+    ]
+
+
+def timed(function, *args, **kwargs):
+    """ Runs function once and returns the result and the elapsed wall clock time in seconds. """
+    start = time.perf_counter()
+    result = function(*args, **kwargs)
+    return result, time.perf_counter() - start
+
+
+def report(name, seconds, count):
+    print("{name:<40} {seconds:>9.3f}s {rate:>14,.0f} files/s".format(name=name, seconds=seconds, rate=count / seconds if seconds else 0))
+
+
+def bench_usage(args):
+    """ directory_usage, largest_files and oldest_files against collecting find_files, stat'ing every file again and sorting.
+        Times are without tracing, the peak traced memory comes from a second run.
+    """
+    root = make_tree(args.root, args.files)
+
+    def collected_usage():
+        usage = {}
+        for path in fileutility.find_files(root):
+            directory = os.path.dirname(path)
+            size = os.stat(path).st_size
+            while True:
+                files, total = usage.get(directory, (0, 0))
+                usage[directory] = (files + 1, total + size)
+                if directory == root:
+                    break
+                directory = os.path.dirname(directory)
+        return usage
+
+    def collected_top(field):
+        return sorted(((getattr(os.stat(x), field), x) for x in fileutility.find_files(root)), reverse=field == 'st_size')[:1000]
+
+    for name, function in [
+        ('find_files + stat + rollup', collected_usage),
+        ('directory_usage', lambda: fileutility.directory_usage(root)),
+        ('find_files + stat + sort size', lambda: collected_top('st_size')),
+        ('largest_files 1000', lambda: fileutility.largest_files(root, 1000)),
+        ('find_files + stat + sort mtime', lambda: collected_top('st_mtime')),
+        ('oldest_files 1000', lambda: fileutility.oldest_files(root, 1000)),
+    ]:
+        found, seconds = timed(function)
+        tracemalloc.start()
+        function()
+        peak = tracemalloc.get_traced_memory()[1]
+        tracemalloc.stop()
+        print("{name:<40} {seconds:>9.3f}s  peak {peak:>8.1f} MiB".format(name=name, seconds=seconds, peak=peak / 1048576.0))
+
+
+def bench_stats(args):
+    """ The overhead of collecting Stats on find_files and find_datetime_named_files, and what formatting the file list for the
+        debug message at the start of delete_files cost before it was guarded.
+    """
+    # The names in the synthetic tree hold no dates, the date named scan runs on the yyyy/mm/dd archive instead.
+    trees = {'find_files': make_tree(args.root, args.files), 'find_datetime_named_files': make_archive(args.root + '-archive')}
+    minimum = datetime.datetime.now()
+    for name, function in [('find_files', fileutility.find_files), ('find_datetime_named_files', fileutility.find_datetime_named_files)]:
+        root = trees[name]
+        found, seconds = timed(function, root, minimum_file_age=minimum)
+        report(name, seconds, len(found))
+        stats = fileutility.Stats()
+        found, seconds = timed(function, root, minimum_file_age=minimum, stats=stats)
+        report(name + ' stats', seconds, len(found))
+        print("{blank:<40} {stats!r}".format(blank='', stats=stats))
+
+    files = fileutility.find_files(trees['find_files'])
+    ignored, seconds = timed("Starting to delete files: {files}".format, files=files)
+    report('unguarded delete_files debug message', seconds, len(files))
+
+
+def bench_walk(args):
+    """ os.listdir + isfile + isdir recursion against the os.scandir walker, with and without an mtime filter. """
+    root = make_tree(args.root, args.files)
+    found, seconds = timed(legacy_do_scan, root)
+    report('legacy do_scan', seconds, len(found))
+    found, seconds = timed(lambda: [x.path for x in fileutility._walk(root, -1)])
+    report('_walk', seconds, len(found))
+
+    minimum = fileutility.datetime.datetime.now()
+    found, seconds = timed(lambda: [x for x in legacy_do_scan(root) if fileutility.datetime.datetime.fromtimestamp(os.path.getmtime(x)) <= minimum])
+    report('legacy do_scan + getmtime', seconds, len(found))
+    found, seconds = timed(lambda: [x.path for x in fileutility._walk(root, -1) if fileutility.datetime.datetime.fromtimestamp(x.stat().st_mtime) <= minimum])
+    report('_walk + DirEntry.stat', seconds, len(found))
+
+
+def first_result_and_peak(function):
+    """ Returns the seconds until function produced its first file, the total seconds and the peak traced memory in bytes. """
+    tracemalloc.start()
+    start = time.perf_counter()
+    first = None
+    for _ in function():
+        if first is None:
+            first = time.perf_counter() - start
+    total = time.perf_counter() - start
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    return first, total, peak
+
+
+def bench_iter(args):
+    """ Time to first result and peak memory of find_files (a list) against iter_files (a generator). """
+    root = make_tree(args.root, args.files)
+    for name, function in [
+        ('find_files', lambda: fileutility.find_files(root, file_suffix='.log')),
+        ('iter_files', lambda: fileutility.iter_files(root, file_suffix='.log')),
+    ]:
+        first, total, peak = first_result_and_peak(function)
+        print("{name:<40} first {first:>8.4f}s  total {total:>8.3f}s  peak {peak:>8.1f} MiB".format(name=name, first=first, total=total, peak=peak / 1048576.0))
+
+
+def bench_filter(args):
+    """ Per file cost of _filter_files and _filter_datetime_named_files at 10k, 100k and 1M files, which must stay flat.
+        The legacy list filter is quadratic and is only timed at the smaller sizes.
+        Exits non-zero if the per file cost at the largest size is more than 3 times the cost at the smallest.
+    """
+    minimum = datetime.datetime(2016, 1, 1)
+    maximum = datetime.datetime(2015, 2, 1)
+    per_file = {'_filter_files': [], '_filter_datetime_named_files': []}
+    for count in (10000, 100000, 1000000):
+        entries = fake_entries(count)
+        found, seconds = timed(lambda: list(fileutility._filter_files(entries, '.log', minimum, maximum)))
+        report('_filter_files {count}'.format(count=count), seconds, count)
+        per_file['_filter_files'].append(seconds / count)
+        found, seconds = timed(lambda: list(fileutility._filter_datetime_named_files(entries, '.log', minimum, maximum, None)))
+        report('_filter_datetime_named_files {count}'.format(count=count), seconds, count)
+        per_file['_filter_datetime_named_files'].append(seconds / count)
+
+    with tempfile.TemporaryDirectory(prefix='fileutility-bench-') as directory:
+        for count in (2000, 10000):
+            paths = []
+            for n in range(count):
+                path = os.path.join(directory, 'file{n}{suffix}'.format(n=n, suffix='.log' if n % 2 else '.txt'))
+                open(path, 'a').close()
+                paths.append(path)
+            found, seconds = timed(legacy_filter_files, paths, '.log', datetime.datetime.now(), maximum)
+            report('legacy _filter_files {count}'.format(count=count), seconds, count)
+
+    for name, costs in sorted(per_file.items()):
+        ratio = costs[-1] / costs[0]
+        print("{name} per file cost 1M / 10k: {ratio:.2f}".format(name=name, ratio=ratio))
+        if ratio > 3:
+            raise SystemExit("{name} no longer scales linearly".format(name=name))
+
+
+DATED_NAMES = [
+    'app-2018-08-17.log', 'app_2018_08_17.log.gz', 'backup.18Aug17.tar.gz', 'db-2018August17.sql',
+    'report.18-aug-17.csv', 'trace-2018-08-17T10:10:10.100.json',
+]
+UNDATED_NAMES = ['app.log', 'README', 'core.1234', 'index.html', 'data-v2.bin', 'notes.txt']
+
+
+def bench_dates(args):
+    """ Filenames parsed per second by the date matching, for dated names, undated names and _filter_datetime_named_files.
+        The filter is called once per 1000 names, as it is once per scan, so the per call setup is part of the number.
+    """
+    count = 200000
+    for label, names in [('dated names', DATED_NAMES), ('undated names', UNDATED_NAMES)]:
+        names = [names[n % len(names)] for n in range(count)]
+        found, seconds = timed(lambda: [fileutility._match_date(x) for x in names])
+        report('_match_date {label}'.format(label=label), seconds, count)
+
+    entries = [FakeEntry('/logs', x, 0) for x in (DATED_NAMES + UNDATED_NAMES) * (count // 12)]
+    batches = [entries[n:n + 1000] for n in range(0, len(entries), 1000)]
+    found, seconds = timed(lambda: [x for batch in batches for x in fileutility._filter_datetime_named_files(batch, None, None, None, None)])
+    report('_filter_datetime_named_files', seconds, len(entries))
+
+
+class slow_file_system(object):
+    """ Adds latency seconds to every call of the named os functions while active, to stand in for an NFS or FUSE mount. """
+
+    def __init__(self, latency, names=('scandir',)):
+        self.latency = latency
+        self.originals = dict((x, getattr(os, x)) for x in names)
+
+    def __enter__(self):
+        for name, original in self.originals.items():
+            setattr(os, name, self._slowed(original))
+        return self
+
+    def __exit__(self, *exc_info):
+        for name, original in self.originals.items():
+            setattr(os, name, original)
+
+    def _slowed(self, function):
+        def slowed(*args, **kwargs):
+            time.sleep(self.latency)
+            return function(*args, **kwargs)
+        return slowed
+
+
+def bench_workers(args):
+    """ find_files with an increasing number of workers on a tree of small directories where every listing takes 2ms.
+        The tree is capped at 20k files in 2000 directories to keep the serial run short.
+    """
+    root = make_tree(args.root, min(args.files, 20000), files_per_directory=10)
+    with slow_file_system(0.002):
+        found, serial = timed(fileutility.find_files, root)
+        report('find_files', serial, len(found))
+        for workers in (2, 4, 8, 16, 32):
+            for ordered in (True, False):
+                found, seconds = timed(fileutility.find_files, root, workers=workers, ordered=ordered)
+                report('find_files workers={workers} ordered={ordered}'.format(workers=workers, ordered=ordered), seconds, len(found))
+                print("{blank:<40} speedup {speedup:.1f}x".format(blank='', speedup=serial / seconds))
+
+
+def bench_index(args):
+    """ Repeat scan latency with a DirectoryIndex against a plain scan, on local disk and with 2ms added to every listing.
+        The slowed tree is capped at 20k files in 2000 directories.
+    """
+    for label, root, latency in [
+        ('local', make_tree(args.root, args.files), 0),
+        ('slow', make_tree(args.root + '-small', min(args.files, 20000), files_per_directory=10), 0.002),
+    ]:
+        with tempfile.TemporaryDirectory(prefix='fileutility-bench-') as directory, slow_file_system(latency):
+            index = fileutility.DirectoryIndex(os.path.join(directory, 'index.db'))
+            # A freshly generated tree is inside the racy window and would never be trusted.
+            index.racy_seconds = 0
+            found, seconds = timed(fileutility.find_files, root)
+            report('{label} find_files'.format(label=label), seconds, len(found))
+            found, seconds = timed(fileutility.find_files, root, index=index)
+            report('{label} find_files index, first scan'.format(label=label), seconds, len(found))
+            for run in range(3):
+                found, seconds = timed(fileutility.find_files, root, index=index)
+                report('{label} find_files index, repeat scan'.format(label=label), seconds, len(found))
+            minimum = datetime.datetime.now()
+            found, seconds = timed(fileutility.find_files, root, minimum_file_age=minimum)
+            report('{label} find_files mtime filter'.format(label=label), seconds, len(found))
+            found, seconds = timed(fileutility.find_files, root, minimum_file_age=minimum, index=index)
+            report('{label} find_files mtime filter, index'.format(label=label), seconds, len(found))
+            index.close()
+
+
+def bench_delete(args):
+    """ delete_files throughput with an increasing number of workers, on local disk (capped at 100k files) and with
+        1ms added to every os.remove (5000 files). Every run deletes a freshly generated tree including its directories.
+    """
+    for label, count, latency in [('local', min(args.files, 100000), 0), ('slow', 5000, 0.001)]:
+        for workers in (None, 4, 16):
+            root = make_tree(args.root + '-delete', count, files_per_directory=100)
+            files = fileutility.find_files(root)
+            with slow_file_system(latency, ('remove',)):
+                result, seconds = timed(fileutility.delete_files, files, directory_delete=True, root=root, workers=workers)
+            report('{label} delete_files workers={workers}'.format(label=label, workers=workers), seconds, result.files_deleted)
+            shutil.rmtree(root)
+            # The spec make_tree recorded next to the tree, it would otherwise be taken for the deleted tree.
+            os.remove(root + '.spec.json')
+
+
+def bench_async(args):
+    """ Event loop lag while the tree is scanned: find_files called from a coroutine against async_find_files,
+        one root and 8 concurrent scans sharing a semaphore of 4.
+    """
+    root = make_tree(args.root, args.files)
+
+    async def measure(scan):
+        lag = [0.0]
+        scanning = True
+
+        async def ticker():
+            while scanning:
+                start = time.perf_counter()
+                await asyncio.sleep(0.001)
+                lag.append(time.perf_counter() - start - 0.001)
+
+        task = asyncio.ensure_future(ticker())
+        # Let the ticker start its first sleep before the scan begins.
+        await asyncio.sleep(0)
+        start = time.perf_counter()
+        found = await scan()
+        seconds = time.perf_counter() - start
+        scanning = False
+        await task
+        lag.sort()
+        return found, seconds, lag[-1], lag[len(lag) * 99 // 100]
+
+    async def blocking():
+        return len(fileutility.find_files(root))
+
+    async def one():
+        return len([x async for x in fileutility.async_find_files(root)])
+
+    async def many():
+        semaphore = asyncio.Semaphore(4)
+
+        async def scan():
+            return len([x async for x in fileutility.async_find_files(root, semaphore=semaphore)])
+        return sum(await asyncio.gather(*[scan() for _ in range(8)]))
+
+    for name, scan in [('find_files in a coroutine', blocking), ('async_find_files', one), ('async_find_files x8', many)]:
+        found, seconds, worst, p99 = asyncio.run(measure(scan))
+        report(name, seconds, found)
+        print("{blank:<40} loop lag max {worst:.4f}s p99 {p99:.4f}s".format(blank='', worst=worst, p99=p99))
+
+
+class counting_stat(object):
+    """ Counts the calls to os.stat while active. os.path.isfile, isdir and getmtime all go through it,
+        as does the dir_fd relative stat of the walker. os.DirEntry.stat does not and is not counted.
+    """
+
+    def __enter__(self):
+        self.calls = 0
+        self.stat = os.stat
+
+        def stat(*args, **kwargs):
+            self.calls += 1
+            return self.stat(*args, **kwargs)
+        os.stat = stat
+        return self
+
+    def __exit__(self, *exc_info):
+        os.stat = self.stat
+
+
+def bench_retention(args):
+    """ retention_plan over 10k, 100k and 1M backup names, 24 a day, with the daily, weekly, monthly and yearly rules all set.
+        The names are generated in memory, no files are created. The per file cost should only grow with log n from the sort.
+    """
+    start = datetime.datetime(2000, 1, 1)
+    for count in (10000, 100000, 1000000):
+        files = ['/backups/{date:%Y}/db-{date:%Y-%m-%d}.{hour:02d}.sql.gz'.format(date=start + datetime.timedelta(hours=n), hour=n % 24) for n in range(count)]
+        plan, seconds = timed(fileutility.retention_plan, files, keep_last=24, keep_daily=7, keep_weekly=4, keep_monthly=12, keep_yearly=10)
+        report('retention_plan {count}'.format(count=count), seconds, count)
+        print("{blank:<40} {plan!r}  {cost:.2f} us/file".format(blank='', plan=plan, cost=seconds / count * 1e6))
+
+
+def bench_startup(args):
+    """ The fileutility command line tool against find(1), on an empty directory for the start up cost and on the whole tree.
+        Start up is the mean of 20 runs, python -c pass is the floor any Python tool starts from.
+        PYTHONDONTWRITEBYTECODE is cleared so the tool runs from its cached bytecode, as an installed one would.
+    """
+    root = make_tree(args.root, args.files)
+    # The launcher rather than fileutility.py itself, a script run directly is compiled on every start, an imported module is not.
+    tool = [sys.executable, os.path.join(os.path.dirname(os.path.abspath(__file__)), 'fileutility')]
+    environment = dict((x, y) for x, y in os.environ.items() if x != 'PYTHONDONTWRITEBYTECODE')
+
+    def run(command):
+        subprocess.check_call(command, stdout=subprocess.DEVNULL, env=environment)
+
+    empty = tempfile.mkdtemp(prefix='fileutility-bench-empty-')
+    try:
+        run(tool + ['find', empty])
+        for name, command in [('python -c pass', [sys.executable, '-c', 'pass']), ('find -type f', ['find', empty, '-type', 'f']),
+                              ('fileutility find', tool + ['find', empty])]:
+            ignored, seconds = timed(lambda: [run(command) for _ in range(20)])
+            print("{name:<40} {milliseconds:>9.1f}ms per start".format(name='start up ' + name, milliseconds=seconds / 20 * 1000))
+    finally:
+        os.rmdir(empty)
+
+    for name, command in [('find -type f -print0', ['find', root, '-type', 'f', '-print0']), ('fileutility find -0', tool + ['find', root, '-0']),
+                          ('find -name *.log', ['find', root, '-type', 'f', '-name', '*.log']), ('fileutility find --suffix .log', tool + ['find', root, '--suffix', '.log'])]:
+        ignored, seconds = timed(run, command)
+        report(name, seconds, args.files)
+
+
+def bench_stat(args):
+    """ stat calls per file and time of an mtime window query: legacy do_scan with a getmtime per bound against find_files. """
+    root = make_tree(args.root, args.files)
+    minimum = datetime.datetime.now()
+    maximum = datetime.datetime(2000, 1, 1)
+
+    def legacy():
+        files = legacy_do_scan(root)
+        files = [x for x in files if datetime.datetime.fromtimestamp(os.path.getmtime(x)) <= minimum]
+        return [x for x in files if datetime.datetime.fromtimestamp(os.path.getmtime(x)) >= maximum]
+
+    for name, function in [
+        ('legacy do_scan + getmtime', legacy),
+        ('find_files', lambda: fileutility.find_files(root, minimum_file_age=minimum, maximum_file_age=maximum)),
+        ('find_files with suffix', lambda: fileutility.find_files(root, file_suffix='a.log', minimum_file_age=minimum, maximum_file_age=maximum)),
+    ]:
+        with counting_stat() as counter:
+            found, seconds = timed(function)
+        report(name, seconds, len(found))
+        print("{blank:<40} {calls:,} os.stat calls, {per:.2f} per file found".format(blank='', calls=counter.calls, per=counter.calls / float(len(found))))
+
+
+def bench_processes(args):
+    """ find_datetime_named_files with an increasing number of processes on a yyyy/mm/dd archive of 10 years.
+        Parsing the dates keeps a core busy, so this scales with the cores of the host rather than with the file system.
+        The archive is capped at 200k files.
+    """
+    per_day = max(1, min(args.files, 200000) // 3650)
+    root = make_archive(args.root + '-processes', files_per_day=per_day)
+    minimum = datetime.datetime(2012, 1, 1)
+    found, serial = timed(fileutility.find_datetime_named_files, root, minimum_file_age=minimum)
+    report('find_datetime_named_files', serial, len(found))
+    for processes in (1, 2, 4, 8):
+        found, seconds = timed(fileutility.find_datetime_named_files, root, minimum_file_age=minimum, processes=processes)
+        report('find_datetime_named_files processes={processes}'.format(processes=processes), seconds, len(found))
+        print("{blank:<40} speedup {speedup:.1f}x on {cpus} cpus".format(blank='', speedup=serial / seconds, cpus=os.cpu_count()))
+
+
+def bench_memory(args):
+    """ Memory held by the result and peak memory while scanning, for find_files returning a list against a FileSet,
+        with and without the size and mtime columns, and the time to sort and filter the FileSet on its columns.
+    """
+    root = make_tree(args.root, args.files)
+    for name, function in [
+        ('find_files', lambda: fileutility.find_files(root)),
+        ('find_files compact=True', lambda: fileutility.find_files(root, compact=True)),
+        ('FileSet stat=True', lambda: fileutility.FileSet(fileutility.iter_files(root), stat=True)),
+    ]:
+        # Timed apart from the memory measurement, tracing every allocation slows the FileSet down far more than the list.
+        found, seconds = timed(function)
+        found = None
+        tracemalloc.start()
+        found = function()
+        held, peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+        print("{name:<40} {seconds:>9.3f}s  held {held:>8.1f} MiB  peak {peak:>8.1f} MiB  {per:>6.0f} bytes/file".format(
+            name=name, seconds=seconds, held=held / 1048576.0, peak=peak / 1048576.0, per=held / len(found)))
+
+    ignored, seconds = timed(found.sort, 'size', True)
+    report('FileSet.sort size', seconds, len(found))
+    ignored, seconds = timed(found.sort)
+    report('FileSet.sort path', seconds, len(found))
+    selected, seconds = timed(found.filter, minimum_file_age=fileutility.datetime.datetime.now())
+    report('FileSet.filter minimum_file_age', seconds, len(found))
+
+
+def bench_prune(args):
+    """ A one week query on a ten year yyyy/mm/dd archive, with and without prune_directories, and the directories each one lists. """
+    root = make_archive(args.root + '-archive')
+    minimum = datetime.datetime(2015, 6, 21)
+    maximum = datetime.datetime(2015, 6, 14)
+    for prune in (False, True):
+        listed = []
+        scan_directory = fileutility._scan_directory
+
+        def counting_scan(directory, *args, **kwargs):
+            listed.append(directory)
+            return scan_directory(directory, *args, **kwargs)
+        fileutility._scan_directory = counting_scan
+        try:
+            found, seconds = timed(fileutility.find_datetime_named_files, root, minimum_file_age=minimum, maximum_file_age=maximum, prune_directories=prune)
+        finally:
+            fileutility._scan_directory = scan_directory
+        report('find_datetime_named_files prune={prune}'.format(prune=prune), seconds, len(found))
+        print("{blank:<40} {listed:,} directories listed".format(blank='', listed=len(listed)))
+
+
+def bench_exclude(args):
+    """ A project tree where most files sit in node_modules and .git, searched for the source files with a PathFilter excluding
+        those directories and with the same exclusion applied to the paths after a full walk, as was the only way before.
+    """
+    root = args.root + '-project'
+    make_tree(os.path.join(root, 'src'), args.files // 20)
+    make_tree(os.path.join(root, 'node_modules'), args.files * 3 // 4)
+    make_tree(os.path.join(root, '.git'), args.files // 5)
+    excluded = (os.path.join(root, 'node_modules', ''), os.path.join(root, '.git', ''))
+
+    found, seconds = timed(lambda: [x for x in fileutility.find_files(root, file_suffix='.log') if not x.startswith(excluded)])
+    report('find_files then exclude', seconds, len(found))
+    for name, path_filter in [('exclude_directories', fileutility.PathFilter(exclude_directories=['node_modules', '.git'])),
+                              ('gitignore', fileutility.PathFilter(exclude=['node_modules/', '/.git/', '*.tmp', '!keep.tmp'], gitignore=True)),
+                              ('include, exclude dirs', fileutility.PathFilter(include=['*.log'], exclude_directories=['node_modules', '.git']))]:
+        stats = fileutility.Stats()
+        found, seconds = timed(fileutility.find_files, root, file_suffix='.log', path_filter=path_filter, stats=stats)
+        report('find_files ' + name, seconds, len(found))
+        print("{blank:<40} {listed:,} directories listed".format(blank='', listed=stats.directories_visited))
+
+
+BENCHMARKS = {
+    'async': bench_async,
+    'dates': bench_dates,
+    'delete': bench_delete,
+    'exclude': bench_exclude,
+    'filter': bench_filter,
+    'index': bench_index,
+    'iter': bench_iter,
+    'memory': bench_memory,
+    'processes': bench_processes,
+    'prune': bench_prune,
+    'retention': bench_retention,
+    'startup': bench_startup,
+    'stat': bench_stat,
+    'stats': bench_stats,
+    'usage': bench_usage,
+    'walk': bench_walk,
+    'workers': bench_workers,
+}
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmarks for fileutility.")
+    parser.add_argument('benchmark', choices=sorted(BENCHMARKS))
+    parser.add_argument('--files', type=int, default=1000000, help="number of files in the synthetic tree")
+    parser.add_argument('--root', help="where to build the synthetic tree, it is kept for later runs when given")
+    args = parser.parse_args(argv)
+
+    keep = args.root is not None
+    if not keep:
+        args.root = os.path.join(tempfile.mkdtemp(prefix='fileutility-bench-'), 'tree')
+    try:
+        BENCHMARKS[args.benchmark](args)
+    finally:
+        if not keep:
+            shutil.rmtree(os.path.dirname(args.root))
+
+
+if __name__ == '__main__':
+    main()
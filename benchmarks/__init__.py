@@ -0,0 +1,11 @@
+""" benchmarks
+Reproducible benchmarks of every public entry point of fileutility.
+
+generator builds a synthetic tree from a TreeSpec with a seeded random generator, so every run on every machine sees the same tree.
+cases holds the benchmark cases, the entry points with the parameter combinations that take a different code path.
+runner times the cases, writes the results as JSON and compares two results files against a threshold.
+
+python -m benchmarks run --files 100000 --root /tmp/fileutility-tree --output baseline.json
+python -m benchmarks run --files 100000 --root /tmp/fileutility-tree --baseline baseline.json --threshold 0.1
+python -m benchmarks compare baseline.json current.json
+"""
@@ -0,0 +1,104 @@
+# -*- coding: utf-8 -*-
+import argparse
+import fnmatch
+import os
+import shutil
+import sys
+import tempfile
+
+from benchmarks import cases, generator, runner
+
+
+def main(argv=None):
+    """ python -m benchmarks run times the cases and python -m benchmarks compare checks one run against another.
+        Returns the exit status, 1 if a case got slower than the threshold allows or returned a different number of files
+        and 2 if the runs can not be compared.
+    """
+    parser = argparse.ArgumentParser(prog='python -m benchmarks', description='Benchmarks for fileutility.')
+    commands = parser.add_subparsers(dest='command', metavar='command')
+    commands.required = True
+
+    defaults = generator.TreeSpec()
+    runs = commands.add_parser('run', help='time the cases against a synthetic tree', description='Time the cases against a synthetic tree.')
+    runs.add_argument('--root', help='where to build the tree, it is kept for later runs when given')
+    runs.add_argument('--files', type=int, default=defaults.files, help='number of files in the tree')
+    runs.add_argument('--breadth', type=int, default=defaults.breadth, help='subdirectories of every directory')
+    runs.add_argument('--depth', type=int, default=defaults.depth, help='levels of subdirectories below the root')
+    runs.add_argument('--dated', type=float, default=defaults.dated, help='fraction of files with a date in their name')
+    runs.add_argument('--mixed', dest='archive', action='store_false', help='mix the dated files in instead of keeping them in archive/yyyy/mm/dd')
+    runs.add_argument('--mtime-days', type=int, default=defaults.mtime_days, help='days the mtimes are spread over')
+    runs.add_argument('--seed', type=int, default=defaults.seed, help='seed of the tree generator')
+    runs.add_argument('--repeat', type=int, default=5, help='timed runs of every case')
+    runs.add_argument('--case', dest='patterns', action='append', metavar='GLOB', help='only the cases matching GLOB, may be repeated')
+    runs.add_argument('--list', action='store_true', help='list the cases and exit')
+    runs.add_argument('--output', metavar='FILE', help='write the results as JSON to FILE')
+    runs.add_argument('--baseline', metavar='FILE', help='compare the results with those in FILE')
+
+    comparer = commands.add_parser('compare', help='compare two results files', description='Compare two results files.')
+    comparer.add_argument('baseline')
+    comparer.add_argument('current')
+    for command in (runs, comparer):
+        command.add_argument('--threshold', type=float, default=0.1, help='fraction a case may get slower before it fails, default 0.1')
+        command.add_argument('--noise', type=float, default=0.002, help='seconds a case may get slower regardless of the threshold')
+    args = parser.parse_args(argv)
+
+    try:
+        if args.command == 'compare':
+            return _check(runner.load(args.baseline), runner.load(args.current), args)
+        return _run(args)
+    except RuntimeError as error:
+        # A case returned a different number of files between rounds or the command line tool failed.
+        sys.stderr.write("benchmarks: {error}\n".format(error=error))
+        return 1
+    except (OSError, ValueError) as error:
+        sys.stderr.write("benchmarks: {error}\n".format(error=error))
+        return 2
+
+
+def _run(args):
+    """ python -m benchmarks run, see main. """
+    selected = [x for x in cases.CASES.values() if not args.patterns or any(fnmatch.fnmatchcase(x.name, y) for y in args.patterns)]
+    if args.list:
+        for case in selected:
+            print(case.name)
+        return 0
+    spec = generator.TreeSpec(files=args.files, breadth=args.breadth, depth=args.depth, dated=args.dated, archive=args.archive,
+                              mtime_days=args.mtime_days, seed=args.seed)
+    baseline = runner.load(args.baseline) if args.baseline else None
+    if baseline is not None and baseline['tree'] != spec.as_dict():
+        raise ValueError("{baseline} was made on a different tree: {tree}".format(baseline=args.baseline, tree=baseline['tree']))
+
+    keep = args.root is not None
+    root = args.root if keep else os.path.join(tempfile.mkdtemp(prefix='fileutility-tree-'), 'tree')
+    try:
+        generator.make_tree(root, spec)
+        results = runner.run(selected, root, spec, args.repeat, progress=_progress)
+    finally:
+        if not keep:
+            shutil.rmtree(os.path.dirname(root))
+    if args.output:
+        runner.save(results, args.output)
+    if baseline is not None:
+        return _check(baseline, results, args)
+    return 0
+
+
+def _progress(name, result):
+    print("{name:<45} {seconds:>9.4f}s {count:>10,} files".format(name=name, seconds=result['min'], count=result['count']))
+    sys.stdout.flush()
+
+
+def _check(baseline, current, args):
+    """ Prints the comparison of current with baseline, returns 1 if anything failed. """
+    comparisons = runner.compare(baseline, current, args.threshold, args.noise)
+    print("{name:<45} {baseline:>10} {current:>10} {ratio:>8} status".format(name='case (minimum seconds)', baseline='baseline', current='current', ratio='ratio'))
+    runner.write_report(comparisons)
+    failed = [x.name for x in comparisons if x.failed]
+    if failed:
+        sys.stderr.write("{count} of {total} cases regressed: {names}\n".format(count=len(failed), total=len(comparisons), names=', '.join(failed)))
+        return 1
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,135 @@
+# -*- coding: utf-8 -*-
+import asyncio
+import collections
+import contextlib
+import datetime
+import io
+import os
+import shutil
+
+import fileutility
+
+
+""" benchmarks/cases.py
+The benchmark cases, every public entry point of fileutility with the parameter combinations that take a different code path.
+A case is called with the root of a tree built by benchmarks.generator and returns what the entry point returned.
+"""
+
+# The mtimes of a default tree span 2010 to 2020 and the dates in the names 2015 to 2018, these limits keep part of each.
+MTIME_LIMITS = dict(minimum_file_age=datetime.datetime(2017, 1, 1), maximum_file_age=datetime.datetime(2012, 1, 1))
+DATE_LIMITS = dict(minimum_file_age=datetime.datetime(2016, 6, 1), maximum_file_age=datetime.datetime(2016, 1, 1))
+
+# The regexp of the app-yyyy-mm-dd names, as a custom regexp replacing the defaults.
+APP_REGEXP = r'app-([0-9]{4})-([0-9]{2})-([0-9]{2})'
+
+
+class Case(object):
+    """ A benchmark named name timing function(root, *prepare(root, scratch)).
+        prepare, if given, runs before every timed run and is not timed itself, scratch is an empty directory it may use.
+        function returns the files found, or the number of files it handled.
+    """
+
+    def __init__(self, name, function, prepare=None):
+        self.name = name
+        self.function = function
+        self.prepare = prepare
+
+    def __repr__(self):
+        return "Case({name!r})".format(name=self.name)
+
+
+CASES = collections.OrderedDict()
+
+
+def _add(name, function, prepare=None):
+    CASES[name] = Case(name, function, prepare)
+
+
+def _finder(function, **arguments):
+    return lambda root: function(root, **arguments)
+
+
+async def _consume(files):
+    return [x async for x in files]
+
+
+def _warm_index(root, scratch):
+    index = fileutility.DirectoryIndex(':memory:')
+    index.racy_seconds = 0
+    fileutility.find_files(root, index=index)
+    return index,
+
+
+def _copy(root, scratch):
+    """ Copies the first subdirectory of root to scratch, for the cases that delete, and returns the list of its files and the copy. """
+    copy = os.path.join(scratch, 'delete')
+    if os.path.exists(copy):
+        shutil.rmtree(copy)
+    shutil.copytree(os.path.join(root, 'd0'), copy)
+    return fileutility.find_files(copy), copy
+
+
+def _dated_files(root, scratch):
+    return fileutility.find_datetime_named_files(root),
+
+
+def _all_files(root, scratch):
+    return fileutility.find_files(root),
+
+
+def _delete(files, **arguments):
+    return fileutility.delete_files(files, **arguments).files_deleted
+
+
+def _command(root, *argv):
+    """ Runs the fileutility command on root and returns the number of paths it printed. """
+    stdout = io.TextIOWrapper(io.BytesIO())
+    with contextlib.redirect_stdout(stdout):
+        if fileutility.main(list(argv) + [root]):
+            raise RuntimeError("fileutility {command} failed".format(command=' '.join(argv)))
+        stdout.flush()
+    return stdout.buffer.getvalue().count(b'\n')
+
+
+# The parameters every find function is run with, each one takes another path through the walk or the filters.
+_COMMON = [
+    ('', {}),
+    ('suffix', dict(file_suffix='.log')),
+    ('workers=4', dict(workers=4)),
+    ('workers=4 unordered', dict(workers=4, ordered=False)),
+    ('processes=2', dict(processes=2)),
+    ('compact', dict(compact=True)),
+    ('compact=stat', dict(compact='stat')),
+    ('stats', dict(stats=fileutility.Stats())),
+    ('path_filter', dict(path_filter=fileutility.PathFilter(include=['*.log', '*.csv'], exclude_directories=['d0']))),
+    ('gitignore', dict(path_filter=fileutility.PathFilter(exclude=['*.txt', '!data.*.txt', '/d1/'], gitignore=True))),
+]
+
+for label, arguments in _COMMON + [('age', MTIME_LIMITS), ('size', dict(minimum_file_size=1 << 18, maximum_file_size=1 << 19))]:
+    _add(' '.join(['find_files', label]).strip(), _finder(fileutility.find_files, **arguments))
+_add('find_files index', lambda root, index: fileutility.find_files(root, index=index), _warm_index)
+_add('iter_files', _finder(fileutility.iter_files))
+_add('iter_files age', _finder(fileutility.iter_files, **MTIME_LIMITS))
+_add('async_find_files', lambda root: asyncio.run(_consume(fileutility.async_find_files(root))))
+
+for label, arguments in _COMMON + [('age', DATE_LIMITS), ('prune_directories', dict(DATE_LIMITS, prune_directories=True)),
+                                   ('regexp', dict(regexp=APP_REGEXP))]:
+    _add(' '.join(['find_datetime_named_files', label]).strip(), _finder(fileutility.find_datetime_named_files, **arguments))
+_add('find_datetime_named_files index', lambda root, index: fileutility.find_datetime_named_files(root, index=index), _warm_index)
+_add('iter_datetime_named_files', _finder(fileutility.iter_datetime_named_files))
+_add('async_find_datetime_named_files', lambda root: asyncio.run(_consume(fileutility.async_find_datetime_named_files(root))))
+
+_add('directory_usage', _finder(fileutility.directory_usage))
+_add('largest_files', lambda root: fileutility.largest_files(root, 100))
+_add('oldest_files', lambda root: fileutility.oldest_files(root, 100))
+_add('retention_plan', lambda root, files: fileutility.retention_plan(files, keep_last=10, keep_daily=30, keep_weekly=12, keep_monthly=24).keep, _dated_files)
+_add('FileSet', lambda root, files: fileutility.FileSet(files), _all_files)
+_add('FileSet stat', lambda root, files: fileutility.FileSet(files, stat=True), _all_files)
+
+_add('delete_files dry_run', lambda root, files: _delete(files, dry_run=True), _all_files)
+_add('delete_files', lambda root, files, copy: _delete(files, directory_delete=True, root=copy), _copy)
+_add('delete_files workers=4', lambda root, files, copy: _delete(files, workers=4), _copy)
+_add('async_delete_files', lambda root, files, copy: asyncio.run(fileutility.async_delete_files(files)).files_deleted, _copy)
+
+_add('command find', lambda root: _command(root, 'find'))
+_add('command find-dated', lambda root: _command(root, 'find-dated', '--older-than', '2016-06-01'))
@@ -0,0 +1,135 @@
+# -*- coding: utf-8 -*-
+import datetime
+import json
+import os
+import random
+import shutil
+
+
+""" benchmarks/generator.py
+Builds the synthetic trees the benchmarks run against. A tree is described by a TreeSpec and built from a seeded random generator,
+so the same spec gives the same directories, names, sizes and mtimes on every machine and every run.
+"""
+
+# The name layouts of the dated files, one of the patterns the default date regexps of fileutility recognise each.
+DATE_FORMATS = ['app-{d:%Y-%m-%d}', 'backup.{d:%y%b%d}', 'db_{d:%Y_%m_%d}', 'report-{d:%Y%b%d}', 'trace-{d:%Y-%m-%d}T{d:%H:%M:%S}.000']
+
+SUFFIXES = ['.log', '.txt', '.csv', '.tar.gz']
+
+_LETTERS = 'abcdefghijklmnopqrstuvwxyz'
+
+
+class TreeSpec(object):
+    """ The layout of a synthetic tree.
+        files: the number of files.
+        breadth and depth: every directory has breadth subdirectories down to depth levels below the root, the files are spread
+        evenly over all of them at random.
+        dated: the fraction of files with a date in their name, the names of the others hold no digits.
+        archive: with archive the dated files are kept apart in archive/yyyy/mm/dd directories, otherwise they are mixed in.
+        date_start and date_days: the dates in names are spread over date_days days from date_start.
+        mtime_start and mtime_days: the mtimes are spread over mtime_days days from mtime_start.
+        max_size: sizes are spread evenly from 0 to max_size bytes, the files are sparse so large sizes cost no disk space.
+        seed: the seed of the random generator.
+    """
+    _fields = ('files', 'breadth', 'depth', 'dated', 'archive', 'date_start', 'date_days', 'mtime_start', 'mtime_days', 'max_size', 'seed')
+
+    def __init__(self, files=100000, breadth=10, depth=2, dated=0.5, archive=True, date_start='2015-01-01', date_days=3 * 365,
+                 mtime_start='2010-01-01', mtime_days=10 * 365, max_size=1 << 20, seed=0):
+        self.files = files
+        self.breadth = breadth
+        self.depth = depth
+        self.dated = dated
+        self.archive = archive
+        self.date_start = date_start
+        self.date_days = date_days
+        self.mtime_start = mtime_start
+        self.mtime_days = mtime_days
+        self.max_size = max_size
+        self.seed = seed
+
+    def as_dict(self):
+        return dict((x, getattr(self, x)) for x in self._fields)
+
+    def __repr__(self):
+        return "TreeSpec({fields})".format(fields=', '.join('{name}={value!r}'.format(name=x, value=getattr(self, x)) for x in self._fields))
+
+
+def _directories(root, breadth, depth):
+    """ Returns root and every directory below it down to depth levels, breadth subdirectories each, parents before children. """
+    directories = [root]
+    level = [root]
+    for _ in range(depth):
+        level = [os.path.join(x, 'd{n}'.format(n=n)) for x in level for n in range(breadth)]
+        directories.extend(level)
+    return directories
+
+
+def _letters(number):
+    """ number written in letters, so it adds no digits a date regexp could pick up. """
+    letters = []
+    while True:
+        letters.append(_LETTERS[number % 26])
+        number //= 26
+        if not number:
+            break
+    return ''.join(reversed(letters))
+
+
+def files(root, spec):
+    """ Yields (path, size, mtime) of every file of the tree spec describes below root, in the order they are created.
+        Nothing is written, so the expected content of a tree can be computed without building it.
+    """
+    rng = random.Random(spec.seed)
+    directories = _directories(root, spec.breadth, spec.depth)
+    date_start = datetime.datetime.strptime(spec.date_start, '%Y-%m-%d')
+    # Taken as UTC, so the mtimes do not depend on the time zone of the machine.
+    mtime_start = datetime.datetime.strptime(spec.mtime_start, '%Y-%m-%d').replace(tzinfo=datetime.timezone.utc).timestamp()
+    for number in range(spec.files):
+        suffix = SUFFIXES[rng.randrange(len(SUFFIXES))]
+        if rng.random() < spec.dated:
+            day = date_start + datetime.timedelta(seconds=rng.randrange(spec.date_days * 86400))
+            name = rng.choice(DATE_FORMATS).format(d=day)
+            if spec.archive:
+                directory = os.path.join(root, 'archive', '{d:%Y}'.format(d=day), '{d:%m}'.format(d=day), '{d:%d}'.format(d=day))
+            else:
+                directory = directories[rng.randrange(len(directories))]
+        else:
+            name = 'data'
+            directory = directories[rng.randrange(len(directories))]
+        # The number keeps names unique when two files get the same date and format.
+        path = os.path.join(directory, '{name}.{number}{suffix}'.format(name=name, number=_letters(number), suffix=suffix))
+        yield path, rng.randrange(spec.max_size + 1), mtime_start + rng.random() * spec.mtime_days * 86400
+
+
+def make_tree(root, spec):
+    """ Builds the tree spec describes at root and returns root.
+        The spec is recorded next to root, in root.spec.json, and a tree built from the same spec is reused instead of built again.
+    """
+    marker = root.rstrip(os.sep) + '.spec.json'
+    if os.path.exists(marker) and os.path.isdir(root):
+        with open(marker) as f:
+            if json.load(f) == spec.as_dict():
+                return root
+    if os.path.exists(root):
+        shutil.rmtree(root)
+    if os.path.exists(marker):
+        os.remove(marker)
+
+    for directory in _directories(root, spec.breadth, spec.depth):
+        os.makedirs(directory)
+    created = set()
+    for path, size, mtime in files(root, spec):
+        directory = os.path.dirname(path)
+        if directory not in created:
+            os.makedirs(directory, exist_ok=True)
+            created.add(directory)
+        fd = os.open(path, os.O_CREAT | os.O_WRONLY)
+        try:
+            os.ftruncate(fd, size)
+        finally:
+            os.close(fd)
+        os.utime(path, (mtime, mtime))
+
+    with open(marker, 'w') as f:
+        json.dump(spec.as_dict(), f)
+    return root
@@ -0,0 +1,180 @@
+# -*- coding: utf-8 -*-
+import datetime
+import gc
+import json
+import os
+import platform
+import shutil
+import statistics
+import sys
+import tempfile
+import time
+
+
+""" benchmarks/runner.py
+Times benchmark cases against a tree and compares the results of two runs.
+The results of a run are a JSON object holding the machine, the TreeSpec of the tree and, for every case, the number of files
+its entry point returned and the seconds of every timed run:
+
+{"format": 1, "created": "...", "machine": {...}, "tree": {...}, "repeat": 5,
+ "results": {"find_files": {"count": 100000, "min": 0.071, "median": 0.074, "runs": [...]}, ...}}
+"""
+
+FORMAT = 1
+
+
+def _count(result):
+    """ The number of files in what a case returned, consuming it if it is an iterator. """
+    if isinstance(result, int):
+        return result
+    if hasattr(result, '__len__'):
+        return len(result)
+    return sum(1 for _ in result)
+
+
+def _machine():
+    return {
+        'python': platform.python_version(),
+        'implementation': platform.python_implementation(),
+        'platform': platform.platform(),
+        'cpus': os.cpu_count(),
+    }
+
+
+def _time(case, root, scratch):
+    """ Runs case once and returns the number of files it returned and the seconds it took. """
+    arguments = case.prepare(root, scratch) if case.prepare is not None else ()
+    gc.collect()
+    start = time.perf_counter()
+    # Generators only do their work as they are consumed, so counting is part of the timed run.
+    count = _count(case.function(root, *arguments))
+    return count, time.perf_counter() - start
+
+
+def run(cases, root, spec, repeat=5, warmup=1, progress=None):
+    """ Times every case in cases against the tree at root, built from spec, and returns the results of the run.
+        The cases are run in rounds, each case once per round, warmup rounds untimed to fill the caches and then repeat timed ones.
+        A burst of load on the machine then slows down one run of many cases instead of every run of one case, which the minimum
+        of the runs of a case filters out.
+        progress, if given, is called with the name and result entry of each case after the last round.
+    """
+    scratch = tempfile.mkdtemp(prefix='fileutility-benchmarks-')
+    counts = {}
+    runs = dict((x.name, []) for x in cases)
+    try:
+        for round in range(warmup + repeat):
+            for case in cases:
+                count, seconds = _time(case, root, scratch)
+                if counts.setdefault(case.name, count) != count:
+                    raise RuntimeError("{name} returned {count} files, {first} the first time".format(name=case.name, count=count, first=counts[case.name]))
+                if round >= warmup:
+                    runs[case.name].append(seconds)
+    finally:
+        shutil.rmtree(scratch)
+
+    results = {}
+    for case in cases:
+        results[case.name] = {'count': counts[case.name], 'min': min(runs[case.name]), 'median': statistics.median(runs[case.name]), 'runs': runs[case.name]}
+        if progress is not None:
+            progress(case.name, results[case.name])
+    return {
+        'format': FORMAT,
+        'created': datetime.datetime.now().isoformat(timespec='seconds'),
+        'machine': _machine(),
+        'tree': spec.as_dict(),
+        'repeat': repeat,
+        'results': results,
+    }
+
+
+def load(filename):
+    with open(filename) as f:
+        results = json.load(f)
+    if results.get('format') != FORMAT:
+        raise ValueError("{filename} is not a results file of format {format}".format(filename=filename, format=FORMAT))
+    return results
+
+
+def save(results, filename):
+    with open(filename, 'w') as f:
+        json.dump(results, f, indent=2, sort_keys=True)
+        f.write('\n')
+
+
+class Comparison(object):
+    """ One case of compare: the minimum seconds in the baseline and the current run and what compare makes of them.
+        status is 'ok', 'slower', 'faster', 'count' when the number of files differs, 'missing' when the current run lacks the case
+        and 'new' when the baseline does. Only 'slower' and 'count' are failures.
+    """
+    __slots__ = ('name', 'baseline', 'current', 'status')
+
+    def __init__(self, name, baseline, current, status):
+        self.name = name
+        self.baseline = baseline
+        self.current = current
+        self.status = status
+
+    @property
+    def ratio(self):
+        if self.baseline is None or self.current is None or not self.baseline:
+            return None
+        return self.current / self.baseline
+
+    @property
+    def failed(self):
+        return self.status in ('slower', 'count')
+
+
+def _change(old, new, threshold, noise):
+    """ 1 if new took more than threshold, a fraction, longer than old and at least noise seconds more, -1 if the same holds the
+        other way around and 0 otherwise.
+    """
+    difference = new - old
+    if abs(difference) > old * threshold and abs(difference) >= noise:
+        return 1 if difference > 0 else -1
+    return 0
+
+
+def compare(baseline, current, threshold=0.1, noise=0.002):
+    """ Compares the results of two runs case by case and returns a list of Comparison.
+        A case is slower if both the minimum and the median of its runs are slower than threshold and noise allow, see _change.
+        The minimum alone moves with a single lucky run and the median with a burst of load, a real slowdown moves both.
+        noise keeps the cases that only take a few milliseconds from failing on timer jitter. Faster is the same the other way around.
+        Raises ValueError if the runs were made on trees built from different specs, their timings do not compare.
+    """
+    if baseline['tree'] != current['tree']:
+        raise ValueError("the runs were made on different trees: {baseline} and {current}".format(baseline=baseline['tree'], current=current['tree']))
+    comparisons = []
+    for name in list(baseline['results']) + [x for x in current['results'] if x not in baseline['results']]:
+        old = baseline['results'].get(name)
+        new = current['results'].get(name)
+        if new is None:
+            comparisons.append(Comparison(name, old['min'], None, 'missing'))
+            continue
+        if old is None:
+            comparisons.append(Comparison(name, None, new['min'], 'new'))
+            continue
+        changes = set(_change(old[x], new[x], threshold, noise) for x in ('min', 'median'))
+        if old['count'] != new['count']:
+            status = 'count'
+        elif changes == {1}:
+            status = 'slower'
+        elif changes == {-1}:
+            status = 'faster'
+        else:
+            status = 'ok'
+        comparisons.append(Comparison(name, old['min'], new['min'], status))
+    return comparisons
+
+
+def write_report(comparisons, stream=None):
+    """ Writes a line per Comparison to stream, stdout by default. """
+    stream = stream if stream is not None else sys.stdout
+    def seconds(value):
+        return '-' if value is None else '{value:.4f}s'.format(value=value)
+
+    for comparison in comparisons:
+        ratio = comparison.ratio
+        stream.write("{name:<45} {baseline:>10} {current:>10} {ratio:>8} {status}\n".format(
+            name=comparison.name, baseline=seconds(comparison.baseline), current=seconds(comparison.current),
+            ratio='-' if ratio is None else '{ratio:.2f}x'.format(ratio=ratio), status=comparison.status.upper() if comparison.failed else comparison.status))
@@ -1,9 +1,21 @@
 #!/usr/bin/env python
 # -*- coding: utf-8 -*-
+import array
+import collections
+import contextlib
 import datetime
+import errno
+import functools
+import heapq
 import logging
 import os
 import re
+import sys
+import threading
+import time
+
+# asyncio, concurrent.futures and sqlite3 are imported by the functions that use them. Together they take longer to import than
+# a small scan takes to run, which would be paid on every start of the command line tool.
 
 
 """ fileutility.py
@@ -31,9 +43,70 @@ minimum_file_age: All files retrieved must be older than this date.
 maximum_file_age: All files retrieved must be younger than this date.
 regexp: If you want to provide a custom regexp for fetching dates instead of using those provided you can just use this functionality.
 
-delete_files(files:list, directory_delete:bool) -> None
+Both find functions also take workers:int, the number of threads listing directories in parallel, and ordered:bool.
+With ordered=True (default) the result order is the same as without workers, with ordered=False files are returned as directories are listed.
+
+find_datetime_named_files also takes prune_directories:bool and directory_regexp:str. With prune_directories, directories laid
+out as yyyy, yyyy/mm and yyyy/mm/dd whose whole date range is outside the age limits are skipped without being listed.
+directory_regexp replaces that layout, its groups are the year, month and day and it must match the end of the directory path.
+
+Both find functions take path_filter:PathFilter as well. PathFilter(include:list, exclude:list, exclude_directories:list, gitignore:bool)
+holds glob patterns, compiled once and checked while directories are listed, so excluded files are never stat'ed and excluded
+directories are never listed. Patterns without a / match names at any depth, patterns with one match the path relative to path.
+With gitignore, exclude follows the .gitignore syntax, PathFilter.from_gitignore(filename) reads a .gitignore file.
+
+Both find functions take processes:int as well. Each subdirectory of path is then scanned and filtered in a pool of that many
+processes, for scans where the filtering keeps a core busy. Can not be combined with an index.
+
+DirectoryIndex(database:str) is a persistent cache of directory listings in a SQLite database. Pass it as index to any of the find
+functions and only directories whose mtime changed since the previous scan are listed again. index.invalidate(path) forgets path and
+everything below it, index.invalidate() forgets everything.
+
+iter_files(...) and iter_datetime_named_files(...) take the same parameters as find_files and find_datetime_named_files, in the
+same order, but return a generator yielding each file as soon as it is found instead of a list. Parameters only one of the
+variants takes, such as compact, come after all of the shared ones.
+
+find_files and iter_files take minimum_file_size:int and maximum_file_size:int as well, returning only files of at least
+and at most that many bytes.
+
+directory_usage(path, ...) -> dict of directory to DirectoryUsage, the number of files and bytes in each subtree.
+largest_files(path, count, ...) -> list of (path, size) and oldest_files(path, count, ...) -> list of (path, mtime datetime).
+All three take the filters of find_files and compute their result in one pass over the walk, keeping one total per directory
+or a heap of count files, so memory does not grow with the number of files.
+
+Both find functions take compact:bool as well, returning a FileSet instead of a list, or compact='stat' for one with the size and mtime columns. A FileSet stores every directory once and the
+file names in a single buffer, paths are built as they are read. FileSet(files, stat=True) also keeps the size and mtime of each file,
+which FileSet.sort(key) and FileSet.filter(minimum_file_age, maximum_file_age, minimum_file_size, maximum_file_size) work on.
+
+delete_files(files:list, directory_delete:bool, workers:int, dry_run:bool, continue_on_error:bool, root:str) -> DeletionReport
 Files is mandatory and provides the function with the list of files to delete. The files need to be full path or relative path to where the script is running from.
 directory_delete is default set to False. If set to True the script will try to delete the file. Raises OSError if the directory is not empty.
+root: With directory_delete, removes every directory below root left empty by the deletion, bottom-up, instead of only the parents.
+workers: Removes the files with a pool of this many threads.
+dry_run: Removes nothing, the returned report tells what would have been removed.
+continue_on_error: Collects every OSError in the returned report instead of raising the first one.
+The returned DeletionReport holds files_deleted, bytes_freed, directories_deleted and errors.
+
+Stats() collects counters and timings of the calls it is passed to as stats: every find, aggregate and delete function and
+retention_plan take one. It counts directories_visited, directories_cached, entries_seen, stat_calls, regex_evaluations,
+files_matched, files_deleted, bytes_deleted, directories_deleted and delete_errors, and adds up traversal_seconds,
+filter_seconds and delete_seconds. stats.as_dict() returns them for export.
+
+retention_plan(files:list, keep_last:int, keep_daily:int, keep_weekly:int, keep_monthly:int, keep_yearly:int, regexp:str) -> RetentionPlan
+Sorts date named files such as backups by the date in their name and decides which to keep: the newest keep_last files and the
+newest file of each of the most recent keep_daily days, keep_weekly weeks, keep_monthly months and keep_yearly years.
+The returned RetentionPlan holds keep, delete and undated, delete can be passed to delete_files.
+
+async_find_files(...), async_find_datetime_named_files(...) and async_delete_files(...) are the asyncio versions of iter_files,
+iter_datetime_named_files and delete_files. The find functions return async iterators, async_delete_files is a coroutine.
+The blocking file system calls run in batches on the event loop's default executor.
+
+The fileutility command, main(argv:list) -> int, wraps the above for shell pipelines:
+fileutility find PATH [--suffix .gz] [--older-than 2018-08-17|DAYS] [--newer-than ...] [--min-size BYTES] [--max-size BYTES] [-0|--json]
+[--include GLOB] [--exclude GLOB] [--exclude-dir GLOB] [--gitignore FILE] streams iter_files to stdout,
+fileutility find-dated PATH takes --regexp and --prune-directories as well and streams iter_datetime_named_files,
+fileutility delete [-0] [--dry-run] [FILE ...] deletes the files given, or read from stdin, and prints the DeletionReport.
+With --stats every command prints its Stats as a JSON object to stderr when it is done.
 
 ----
 Raises OSError in case path does not exists or directory is not empty when trying to delete.
@@ -41,33 +114,307 @@ Raises TypeError wrong type was provided for any of the input parameters
 """
 logger = logging.getLogger(__name__)
 
+# The date regexps used when no custom regexp is provided. They are tried in this order and the first match wins.
+_DATE_REGEXPS = [
+    r'([0-9]{4})[\-\.\_\ ]?([0-9]{1,2})[\-\.\_\ ]?([0-9]{1,2})',                                                                                # yyyy-mm-dd
+    r'([0-9]{2})[\-\.\_\ ]?(Jan|Feb|Mar|Apr|May|Jun|Jul|Aug|Sep|Oct|Nov|Dec)[\-\.\_\ ]?([0-9]{1,2})',                                           # yyMondd
+    r'([0-9]{4})[\-\.\_\ ]?(Jan|Feb|Mar|Apr|May|Jun|Jul|Aug|Sep|Oct|Nov|Dec)[\-\.\_\ ]?([0-9]{1,2})',                                           # yyyyMondd
+    r'([0-9]{2})[\-\.\_\ ]?(jan|feb|mar|apr|may|jun|jul|aug|sep|oct|nov|dec)[\-\.\_\ ]?([0-9]{1,2})',                                           # yymondd
+    r'([0-9]{4})[\-\.\_\ ]?(jan|feb|mar|apr|may|jun|jul|aug|sep|oct|nov|dec)[\-\.\_\ ]?([0-9]{1,2})',                                           # yyyymondd
+    r'([0-9]{4})[\-\.\_\ ]?(Januari|February|March|April|May|June|July|August|September|October|November|December)[\-\.\_\ ]?([0-9]{1,2})',     # yyyyMondd
+    r'([0-9]{2})[\-\.\_\ ]?(Januari|February|March|April|May|June|July|August|September|October|November|December)[\-\.\_\ ]?([0-9]{1,2})',     # yyMondd
+    r'([0-9]{4})[\-\.\_\ ]?(januari|february|march|april|may|june|july|august|september|october|november|decemeber)[\-\.\_\ ]?([0-9]{1,2})',    # yyyymondd
+    r'([0-9]{2})[\-\.\_\ ]?(januari|february|march|april|may|june|july|august|september|october|november|decemeber)[\-\.\_\ ]?([0-9]{1,2})',    # yymondd
+    r'([0-9]{4})\-([0-9]{2})\-([0-9]{2})T([0-9]{2})\:([0-9]{2})\:([0-9]{2})\.([0-9]{3})',                                                      # Javascript
+]
+
+
+@functools.lru_cache(maxsize=None)
+def _date_regexps():
+    """ Returns _DATE_REGEXPS compiled, on the first call only, so a run that never parses a date does not pay for compiling them. """
+    return [re.compile(x) for x in _DATE_REGEXPS]
+
+def _compile_groups(pattern, groups, name):
+    """ Compiles pattern, raising ValueError if it has fewer than groups capture groups to read the date from. """
+    compiled = re.compile(pattern)
+    if compiled.groups < groups:
+        raise ValueError("{name} {pattern!r} has {found} groups, at least {groups} are needed".format(name=name, pattern=pattern, found=compiled.groups, groups=groups))
+    return compiled
+
+# Every default date regexp needs at least two digits in a row, names without such a run are rejected without trying them.
+_DIGIT_RUN = re.compile(r'[0-9]{2}')
+
+# Month names are matched on their first three letters, which covers both the abbreviated and the full names.
+_MONTHS = {
+    'jan': 1, 'feb': 2, 'mar': 3, 'apr': 4, 'may': 5, 'jun': 6,
+    'jul': 7, 'aug': 8, 'sep': 9, 'oct': 10, 'nov': 11, 'dec': 12,
+}
+
+
+class DeletionReport(object):
+    """ What delete_files did, or with dry_run would have done.
+        files_deleted and bytes_freed count the removed files and their size, directories_deleted the removed directories.
+        errors holds a (path, OSError) tuple for every file or directory that could not be removed when continue_on_error is set.
+    """
+
+    def __init__(self, dry_run=False):
+        self.dry_run = dry_run
+        self.files_deleted = 0
+        self.bytes_freed = 0
+        self.directories_deleted = 0
+        self.errors = []
+
+    def __repr__(self):
+        return "DeletionReport(dry_run={dry_run}, files_deleted={files}, bytes_freed={bytes}, directories_deleted={directories}, errors={errors})".format(
+            dry_run=self.dry_run, files=self.files_deleted, bytes=self.bytes_freed, directories=self.directories_deleted, errors=len(self.errors))
+
+
+# A scan adds its counters to a shared Stats once per this many files, and when it ends.
+_MERGE_FILES = 1000
+
+
+class Stats(object):
+    """ Counters and timings of the scans and deletions it is passed to as stats, for export to monitoring.
+        One Stats passed to several calls in turn adds them all up. as_dict() returns every number by name.
+        directories_visited counts the directories listed, directories_cached those of them answered from a DirectoryIndex.
+        entries_seen counts the files and subdirectories in those listings, stat_calls the stat system calls made on them.
+        regex_evaluations counts the regexp searches made for the dates in file names, files_matched the files passing every filter.
+        files_deleted, bytes_deleted, directories_deleted and delete_errors add up the DeletionReports of delete_files.
+        A dry run removes nothing and only adds its delete_errors.
+        traversal_seconds is the time spent listing directories, filter_seconds applying the filters to the files and
+        delete_seconds removing them. With workers these add up the time of every thread, so they can exceed the time the call took.
+        Every scan counts on a Stats of its own and adds it to this one under a lock as it goes, so scans sharing a Stats may run
+        at the same time, also those of the async API on the executor's threads.
+    """
+    _fields = (
+        'directories_visited', 'directories_cached', 'entries_seen', 'stat_calls', 'regex_evaluations', 'files_matched',
+        'files_deleted', 'bytes_deleted', 'directories_deleted', 'delete_errors', 'traversal_seconds', 'filter_seconds', 'delete_seconds',
+    )
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        for name in self._fields:
+            setattr(self, name, 0.0 if name.endswith('_seconds') else 0)
+
+    def _add(self, **amounts):
+        # Listings and deletions report from worker threads, once per directory or batch.
+        with self._lock:
+            for name, amount in amounts.items():
+                setattr(self, name, getattr(self, name) + amount)
+
+    def _merge(self, tally):
+        """ Adds the counters of tally, the Stats of a single scan, to this one and resets them. """
+        with self._lock:
+            for name in self._fields:
+                amount = getattr(tally, name)
+                if amount:
+                    setattr(self, name, getattr(self, name) + amount)
+                    setattr(tally, name, 0.0 if name.endswith('_seconds') else 0)
+
+    def _filter(self, files, accept, tally):
+        """ Yields the entries in files accept returns True for, counting the time spent in accept and the files it accepts.
+            They are counted on tally, which only the thread consuming the walk touches, and merged into this Stats every
+            _MERGE_FILES files and when the walk ends. accept may count on tally as well.
+        """
+        clock = time.perf_counter
+        try:
+            for count, entry in enumerate(files, 1):
+                start = clock()
+                accepted = accept(entry)
+                tally.filter_seconds += clock() - start
+                if accepted:
+                    tally.files_matched += 1
+                    yield entry
+                if not count % _MERGE_FILES:
+                    self._merge(tally)
+        finally:
+            self._merge(tally)
+
+    def as_dict(self):
+        return dict((x, getattr(self, x)) for x in self._fields)
+
+    def __repr__(self):
+        return "Stats({fields})".format(fields=', '.join('{name}={value}'.format(name=x, value=getattr(self, x)) for x in self._fields))
 
-def delete_files(files, directory_delete=False):
+
+# Files are handed to the deletion workers in batches of this size, which keeps the per file overhead of the thread pool low.
+_DELETE_BATCH_SIZE = 500
+
+
+def _batches(files, size):
+    """ Splits any iterable of files into lists of at most size files, without reading more of it than needed. """
+    batch = []
+    for _file in files:
+        batch.append(_file)
+        if len(batch) == size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+
+def _delete_batch(files, dry_run, continue_on_error, stats=None):
+    """ Removes a batch of files. Returns the files removed, the bytes freed and the errors.
+        Raises the first OSError unless continue_on_error is set. The time it took is added to stats if given.
+    """
+    start = time.perf_counter()
+    # Checked once per batch, the messages below would otherwise be formatted for every file even with debug logging off.
+    debug = logger.isEnabledFor(logging.DEBUG)
+    removed = []
+    freed = 0
+    errors = []
+    for _file in files:
+        if debug:
+            logger.debug("Trying to remove {_file}".format(_file=_file))
+        try:
+            size = os.lstat(_file).st_size
+            if not dry_run:
+                os.remove(_file)
+        except OSError as error:
+            if not continue_on_error:
+                raise
+            if debug:
+                logger.debug("Unable to remove {_file}: {error}".format(_file=_file, error=error))
+            errors.append((_file, error))
+            continue
+        removed.append(_file)
+        freed += size
+    if stats is not None:
+        stats._add(stat_calls=len(removed) + len(errors), delete_seconds=time.perf_counter() - start)
+    return removed, freed, errors
+
+
+def _collect_deleted(result, directory_delete, report, removed):
+    """ Adds the result of a _delete_batch to report, and with directory_delete records in removed the names taken from each directory. """
+    names, freed, errors = result
+    report.files_deleted += len(names)
+    report.bytes_freed += freed
+    report.errors.extend(errors)
+    if directory_delete:
+        for _file in names:
+            directory, name = os.path.split(_file)
+            removed.setdefault(directory, set()).add(name)
+
+
+def _delete_directory(directory, removed, dry_run):
+    """ Removes directory, or with dry_run checks that it would be empty once the names in removed are gone.
+        Raises OSError if the directory is not empty, as os.rmdir does.
+    """
+    if not dry_run:
+        os.rmdir(directory)
+    elif not set(os.listdir(directory)) <= removed.get(directory, set()):
+        raise OSError(errno.ENOTEMPTY, os.strerror(errno.ENOTEMPTY), directory)
+
+
+def _delete_directories(removed, root, dry_run, continue_on_error, report):
+    """ Removes the directories files were deleted from. removed maps each directory to the names removed from it.
+        Without root every such directory is removed and an OSError is raised if one is not empty.
+        With root the directories left empty are removed bottom-up, climbing towards root but never removing root itself or
+        anything outside it. Directories that are not empty are left alone.
+    """
+    if root is None:
+        for directory in removed:
+            if not os.path.isdir(directory):
+                continue
+            if logger.isEnabledFor(logging.DEBUG):
+                logger.debug("Removing directory {_directory}".format(_directory=directory))
+            try:
+                _delete_directory(directory, removed, dry_run)
+            except OSError as error:
+                if not continue_on_error:
+                    raise
+                report.errors.append((directory, error))
+                continue
+            report.directories_deleted += 1
+        return
+
+    root = os.path.join(os.path.abspath(root), '')
+    removed = dict((os.path.abspath(x), names) for x, names in removed.items())
+    # Deepest directories first, a parent is only considered once all of its children have been.
+    pending = [(-x.count(os.sep), x) for x in removed if x.startswith(root)]
+    heapq.heapify(pending)
+    seen = set(x for _, x in pending)
+    while pending:
+        _, directory = heapq.heappop(pending)
+        if logger.isEnabledFor(logging.DEBUG):
+            logger.debug("Removing directory {_directory} if empty".format(_directory=directory))
+        try:
+            _delete_directory(directory, removed, dry_run)
+        except OSError as error:
+            if error.errno not in (errno.ENOTEMPTY, errno.EEXIST, errno.ENOENT):
+                if not continue_on_error:
+                    raise
+                report.errors.append((directory, error))
+            continue
+        report.directories_deleted += 1
+
+        parent, name = os.path.split(directory)
+        removed.setdefault(parent, set()).add(name)
+        if parent.startswith(root) and parent not in seen:
+            seen.add(parent)
+            heapq.heappush(pending, (-parent.count(os.sep), parent))
+
+
+def delete_files(files, directory_delete=False, workers=None, dry_run=False, continue_on_error=False, root=None, stats=None):
     ''' Deletes all files provided
         If directory_delete is set to true, python will try to delete the directory the File resides in. Raises OSError if directory is not empty.
+        If root is set as well, every directory below root that was left empty is removed instead, bottom-up. Directories that are
+        not empty, root itself and directories outside root are left alone.
+        workers defaults to None, if set files are removed by a pool of this many threads.
+        dry_run defaults to False, if set nothing is removed and the returned report tells what would have been.
+        continue_on_error defaults to False, raising the first OSError. If set all errors are collected in the returned report.
+        stats defaults to None, if set to a Stats the deletion is added to it.
+        Returns a DeletionReport.
     '''
-    # Removes each file provided in the list. Splits the string on / and rebuilts it to a string with only directories.
-    logger.debug("Starting to delete files: {files}".format(files=files))
+    if logger.isEnabledFor(logging.DEBUG):
+        logger.debug("Starting to delete files: {files}".format(files=files))
 
-    directories = []
-    for _file in files:
-        logger.debug("Trying to remove {_file}".format(_file=_file))
-        os.remove(_file)
-        if directory_delete:
-            directory = '/'.join(_file.split('/')[0:-1])
-            if os.path.isdir(directory):
-                logger.debug("Adding directory {_directory} for deletion".format(_directory=directory))
-                directories.append(directory)
+    report = DeletionReport(dry_run)
+    removed = {}
+
+    def collect(result):
+        _collect_deleted(result, directory_delete, report, removed)
+
+    batches = _batches(files, _DELETE_BATCH_SIZE)
+    if workers:
+        import concurrent.futures
+        with concurrent.futures.ThreadPoolExecutor(max_workers=workers) as executor:
+            # At most two batches per worker are queued, so a generator of files is consumed as fast as it is deleted.
+            in_flight = collections.deque()
+            try:
+                for batch in batches:
+                    in_flight.append(executor.submit(_delete_batch, batch, dry_run, continue_on_error, stats))
+                    if len(in_flight) >= workers * 2:
+                        collect(in_flight.popleft().result())
+                while in_flight:
+                    collect(in_flight.popleft().result())
+            finally:
+                for future in in_flight:
+                    future.cancel()
+    else:
+        for batch in batches:
+            collect(_delete_batch(batch, dry_run, continue_on_error, stats))
 
     if directory_delete:
-        # Removing duplicate entries to only try to delete dir once.
-        directories = list(set(directories))
-        for directory in directories:
-            logger.debug("Removing directory {_directory}".format(_directory=directory))
-            os.rmdir(directory)
+        _delete_directories(removed, root, dry_run, continue_on_error, report)
+
+    logger.debug("Deletion finished: {report}".format(report=report))
+    if stats is not None:
+        _count_deleted(stats, report)
+    return report
 
 
-def _input_validation(path, file_suffix, recursion_depth, minimum_file_age, maximum_file_age, regexp):
+def _count_deleted(stats, report):
+    """ Adds what a DeletionReport removed to stats. A dry run removed nothing, only its errors are added. """
+    if report.dry_run:
+        stats._add(delete_errors=len(report.errors))
+        return
+    stats._add(files_deleted=report.files_deleted, bytes_deleted=report.bytes_freed, directories_deleted=report.directories_deleted,
+               delete_errors=len(report.errors))
+
+
+def _input_validation(path, file_suffix, recursion_depth, minimum_file_age, maximum_file_age, regexp, workers=None, index=None, directory_regexp=None, processes=None,
+                      minimum_file_size=None, maximum_file_size=None, stats=None, path_filter=None):
     logger.debug("Starting input validation")
     if type(path) is not str:
         raise TypeError("unsupported type for path: {current_type} expected 'str'".format(current_type=type(path)))
@@ -81,81 +428,917 @@ def _input_validation(path, file_suffix, recursion_depth, minimum_file_age, maxi
         raise TypeError("unsupported type for maximum_file_age: {current_type} expected 'datetime.datetime'".format(current_type=type(maximum_file_age)))
     if regexp and type(regexp) is not str:
         raise TypeError("unsupported type for regexp: {current_type} expected 'str'".format(current_type=type(regexp)))
+    if workers and type(workers) is not int:
+        raise TypeError("unsupported type for workers: {current_type} expected 'int'".format(current_type=type(workers)))
+    if index is not None and not isinstance(index, DirectoryIndex):
+        raise TypeError("unsupported type for index: {current_type} expected 'DirectoryIndex'".format(current_type=type(index)))
+    if directory_regexp and type(directory_regexp) is not str:
+        raise TypeError("unsupported type for directory_regexp: {current_type} expected 'str'".format(current_type=type(directory_regexp)))
+    if processes and type(processes) is not int:
+        raise TypeError("unsupported type for processes: {current_type} expected 'int'".format(current_type=type(processes)))
+    if minimum_file_size is not None and type(minimum_file_size) is not int:
+        raise TypeError("unsupported type for minimum_file_size: {current_type} expected 'int'".format(current_type=type(minimum_file_size)))
+    if maximum_file_size is not None and type(maximum_file_size) is not int:
+        raise TypeError("unsupported type for maximum_file_size: {current_type} expected 'int'".format(current_type=type(maximum_file_size)))
+    if stats is not None and not isinstance(stats, Stats):
+        raise TypeError("unsupported type for stats: {current_type} expected 'Stats'".format(current_type=type(stats)))
+    if path_filter is not None and not isinstance(path_filter, PathFilter):
+        raise TypeError("unsupported type for path_filter: {current_type} expected 'PathFilter'".format(current_type=type(path_filter)))
+    if processes and index is not None:
+        raise ValueError("index can not be combined with processes, the index database can not be shared with the worker processes")
+    if processes and stats is not None:
+        raise ValueError("stats can not be combined with processes, the worker processes can not update it")
     logger.debug("Input validation completed successfully")
 
 
-def _filter_files(files, file_suffix, minimum_file_age, maximum_file_age):
-    logger.debug("Starting _filter_files")
-    if file_suffix:
-        logger.debug("File suffix provided. Removing all files not matching {suffix}".format(suffix=file_suffix))
-        suffix = [x for x in files if x.endswith(file_suffix)]
-        files = [x for x in files if x in suffix]
+# Where os.stat takes a directory file descriptor a file is stat'ed by name relative to its open directory,
+# instead of resolving its full path from the root again for every file.
+_STAT_DIR_FD = os.stat in os.supports_dir_fd and os.scandir in os.supports_fd
+
+
+def _scan_directory(directory, name_filter=None, stat=False, stats=None):
+    """ Lists a single directory with os.scandir.
+        Returns the os.DirEntry objects of all files and the paths of all subdirectories.
+        is_file() and is_dir() are answered from the directory listing itself where the platform allows it,
+        and the entries cache their stat() result so the filters never need to stat a file a second time.
+        name_filter, if given, is called with the name of every file and only the files it returns True for are returned.
+        With stat the returned files are stat'ed already, relative to the open directory where the platform supports it.
+        The listing is added to stats if given.
+    """
+    if stat and _STAT_DIR_FD:
+        return _scan_directory_fd(directory, name_filter, stats)
+
+    start = time.perf_counter()
+    files = []
+    directories = []
+    skipped = 0
+    with os.scandir(directory) as scan:
+        for entry in scan:
+            if entry.is_file():
+                if name_filter is None or name_filter(entry.name):
+                    files.append(entry)
+                else:
+                    skipped += 1
+            elif entry.is_dir():
+                directories.append(entry.path)
+    if stats is not None:
+        # Without a directory file descriptor the files are stat'ed by the filters, once each.
+        stats._add(directories_visited=1, entries_seen=len(files) + len(directories) + skipped, stat_calls=len(files) if stat else 0, traversal_seconds=time.perf_counter() - start)
+    return files, directories
+
+
+def _scan_directory_fd(directory, name_filter, stats=None):
+    """ _scan_directory through a directory file descriptor, every file is stat'ed with a single os.stat(name, dir_fd=...). """
+    start = time.perf_counter()
+    files = []
+    directories = []
+    skipped = 0
+    prefix = os.path.join(directory, '')
+    fd = os.open(directory, os.O_RDONLY | getattr(os, 'O_DIRECTORY', 0))
+    try:
+        with os.scandir(fd) as scan:
+            for entry in scan:
+                if entry.is_file():
+                    if name_filter is None or name_filter(entry.name):
+                        try:
+                            files.append(_Entry(prefix + entry.name, entry.name, os.stat(entry.name, dir_fd=fd)))
+                        except FileNotFoundError:
+                            logger.debug("{_file} was removed while scanning {directory}".format(_file=entry.name, directory=directory))
+                    else:
+                        skipped += 1
+                elif entry.is_dir():
+                    directories.append(prefix + entry.name)
+    finally:
+        os.close(fd)
+    if stats is not None:
+        stats._add(directories_visited=1, entries_seen=len(files) + len(directories) + skipped, stat_calls=len(files), traversal_seconds=time.perf_counter() - start)
+    return files, directories
+
+
+class _IndexedEntry(object):
+    """ Stands in for the os.DirEntry of a file read from a DirectoryIndex, and for its stat result, holding the size and mtime kept for it. """
+    __slots__ = ('name', 'path', 'st_size', 'st_mtime_ns')
+
+    def __init__(self, path, name, st_size, st_mtime_ns):
+        self.name = name
+        self.path = path
+        self.st_size = st_size
+        self.st_mtime_ns = st_mtime_ns
+
+    @property
+    def st_mtime(self):
+        return self.st_mtime_ns / 1e9
+
+    def is_file(self):
+        return True
+
+    def is_dir(self):
+        return False
+
+    def stat(self):
+        return self
+
+
+class _Entry(object):
+    """ Stands in for the os.DirEntry of a file whose stat result is already known, read from a DirectoryIndex or stat'ed during the scan. """
+    __slots__ = ('name', 'path', '_stat')
+
+    def __init__(self, path, name, stat):
+        self.name = name
+        self.path = path
+        self._stat = stat
+
+    def is_file(self):
+        return True
+
+    def is_dir(self):
+        return False
+
+    def stat(self):
+        return self._stat
+
+
+class DirectoryIndex(object):
+    """ Persistent cache of directory listings stored in a SQLite database.
+        Pass it as index to find_files and friends. Every directory is stat'ed and listed again only if its mtime changed since
+        the last scan, otherwise its files and subdirectories are read from the database. For mostly static trees a full walk
+        becomes one stat and one row per directory. That pays off where listing and stat'ing are slow, such as network file
+        systems. On a local disk, where the kernel caches the listings, a repeat scan through the index takes about as long as a
+        plain one, up to half as long again, and only a scan with an age or size limit, which has to stat every file, is several times faster.
+        A directory mtime only changes when entries are added, removed or renamed in it. A file that is rewritten in place keeps
+        the size and mtime it had when its directory was last listed, call invalidate for such trees when that matters.
+        Directories are keyed on their path as walked, so the same directory reached through a different root path is listed again.
+    """
+    # A directory modified this close to being listed could change again within the same mtime tick, its listing is not trusted next time.
+    racy_seconds = 2
+
+    # The layout of the database. One written by another version is emptied and filled again, it only holds a cache.
+    _format = 2
+
+    def __init__(self, database):
+        self.database = database
+        import sqlite3
+        self._lock = threading.Lock()
+        self._connection = sqlite3.connect(database, check_same_thread=False)
+        self._connection.execute("PRAGMA journal_mode=WAL")
+        self._connection.execute("PRAGMA synchronous=NORMAL")
+        if self._connection.execute("PRAGMA user_version").fetchone()[0] != self._format:
+            self._connection.execute("DROP TABLE IF EXISTS entries")
+            self._connection.execute("DROP TABLE IF EXISTS directories")
+            self._connection.execute("PRAGMA user_version = {format}".format(format=self._format))
+        # A directory is a single row: the names of its files and subdirectories joined by '/', which no name can hold, and the sizes
+        # and mtimes of its files as packed int64 arrays, so a cached directory is one lookup without a row or object per file in SQLite.
+        self._connection.execute(
+            "CREATE TABLE IF NOT EXISTS directories (path TEXT PRIMARY KEY, mtime_ns INTEGER, files TEXT, subdirectories TEXT, sizes BLOB, mtimes BLOB) "
+            "WITHOUT ROWID")
+        self._connection.commit()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def close(self):
+        """ Commits outstanding updates and closes the database. """
+        with self._lock:
+            self._connection.commit()
+            self._connection.close()
+
+    def commit(self):
+        """ Writes the listings updated by the scans so far to disk. Called when a scan using the index finishes. """
+        with self._lock:
+            self._connection.commit()
+
+    def invalidate(self, path=None):
+        """ Forgets the cached listing of path and every directory below it, or of every directory if path is None.
+            The next scan lists them from the file system again.
+        """
+        logger.debug("Invalidating index {database} below {path}".format(database=self.database, path=path))
+        with self._lock:
+            if path is None:
+                self._connection.execute("DELETE FROM directories")
+            else:
+                # Directories are stored without a trailing separator, 'path/' would match none of them.
+                self._delete(path.rstrip(os.sep) or os.sep)
+            self._connection.commit()
+
+    def _delete(self, path):
+        # Everything below path sorts between "path/" and the same string with the separator incremented by one.
+        below = os.path.join(path, '')
+        above = below[:-1] + chr(ord(below[-1]) + 1)
+        self._connection.execute("DELETE FROM directories WHERE path = ? OR (path >= ? AND path < ?)", (path, below, above))
+
+    def scan_directory(self, directory, name_filter=None, stat=False, stats=None):
+        """ Same contract as _scan_directory, answered from the database when the directory mtime is unchanged.
+            The returned files always carry their stat result, stat is accepted for compatibility only.
+        """
+        start = time.perf_counter()
+        mtime_ns = os.stat(directory).st_mtime_ns
+        with self._lock:
+            row = self._connection.execute("SELECT mtime_ns, files, subdirectories, sizes, mtimes FROM directories WHERE path = ?", (directory,)).fetchone()
+        if row and row[0] == mtime_ns:
+            names = row[1].split('/') if row[1] else []
+            prefix = os.path.join(directory, '')
+            files = [_IndexedEntry(prefix + name, name, size, entry_mtime_ns)
+                     for name, size, entry_mtime_ns in zip(names, array.array('q', row[3]), array.array('q', row[4]))
+                     if name_filter is None or name_filter(name)]
+            directories = [prefix + x for x in row[2].split('/')] if row[2] else []
+            if stats is not None:
+                stats._add(directories_visited=1, directories_cached=1, entries_seen=len(names) + len(directories), stat_calls=1,
+                           traversal_seconds=time.perf_counter() - start)
+            return files, directories
+
+        if logger.isEnabledFor(logging.DEBUG):
+            logger.debug("Directory {directory} changed since it was indexed, listing it".format(directory=directory))
+        files, directories = _scan_directory(directory, stat=True)
+        # Files and subdirectories are kept in listing order so a cached scan returns files in the same order as a fresh one.
+        sizes = array.array('q')
+        mtimes = array.array('q')
+        for entry in list(files):
+            try:
+                entry_stat = entry.stat()
+            except FileNotFoundError:
+                logger.debug("{_file} was removed while indexing {directory}".format(_file=entry.path, directory=directory))
+                files.remove(entry)
+                continue
+            sizes.append(entry_stat.st_size)
+            mtimes.append(entry_stat.st_mtime_ns)
+        names = [os.path.basename(x) for x in directories]
+        if time.time() * 1e9 - mtime_ns < self.racy_seconds * 1e9:
+            mtime_ns = None
+
+        with self._lock:
+            # Subdirectories that disappeared take their whole cached subtree with them.
+            if row and row[2]:
+                for name in set(row[2].split('/')).difference(names):
+                    self._delete(os.path.join(directory, name))
+            self._connection.execute("INSERT OR REPLACE INTO directories VALUES (?, ?, ?, ?, ?, ?)",
+                                     (directory, mtime_ns, '/'.join(x.name for x in files), '/'.join(names), sizes.tobytes(), mtimes.tobytes()))
+        if stats is not None:
+            stats._add(directories_visited=1, entries_seen=len(files) + len(directories), stat_calls=1 + len(files), traversal_seconds=time.perf_counter() - start)
+        if name_filter is not None:
+            files = [x for x in files if name_filter(x.name)]
+        return files, directories
+
+    def _committing(self, walk):
+        """ Passes through everything walk yields and commits once it is exhausted or closed. """
+        try:
+            for entry in walk:
+                yield entry
+        finally:
+            self.commit()
+
+
+def _walk(path, recursion_depth, workers=None, ordered=True, index=None, name_filter=None, stat=False, descend=None, stats=None, path_filter=None):
+    """ Yields an os.DirEntry for every file below path.
+        Directories are visited depth first in listing order, the files of a directory are yielded before its subdirectories are entered.
+        recursion_depth follows the same rules as find_files, -1 is unlimited and 0 is only path itself.
+        With workers the directories are listed by a thread pool of that size, see _parallel_walk.
+        With index the listings come from that DirectoryIndex where they are still valid.
+        name_filter, stat and stats are passed on to _scan_directory.
+        descend, if given, is called with the path of every subdirectory and the walk only enters those it returns True for.
+        path_filter, a PathFilter, is combined with name_filter and descend.
+    """
+    scan_directory = index.scan_directory if index is not None else _scan_directory
+    if path_filter is None:
+        scan = functools.partial(scan_directory, name_filter=name_filter, stat=stat, stats=stats)
+    else:
+        files_in, descend = path_filter._bind(path_filter._root or path, name_filter, descend)
+
+        def scan(directory):
+            return scan_directory(directory, files_in(directory), stat, stats)
+    if descend is not None:
+        list_directory = scan
+
+        def scan(directory):
+            files, directories = list_directory(directory)
+            return files, [x for x in directories if descend(x)]
+    if workers:
+        walk = _parallel_walk(path, recursion_depth, scan, workers, ordered)
+    else:
+        walk = _serial_walk(path, recursion_depth, scan)
+    if index is not None:
+        return index._committing(walk)
+    return walk
+
+
+def _serial_walk(path, recursion_depth, scan):
+    # An explicit stack instead of recursion, subdirectories are pushed in reverse so they are popped in listing order.
+    stack = [(path, 0)]
+    while stack:
+        directory, depth = stack.pop()
+        if logger.isEnabledFor(logging.DEBUG):
+            logger.debug("Scanning directories. Current depth: {depth}. Folder: {folder}.".format(depth=depth, folder=directory))
+        files, directories = scan(directory)
+        for entry in files:
+            yield entry
+
+        if recursion_depth == -1 or depth < recursion_depth:
+            stack.extend((x, depth + 1) for x in reversed(directories))
+
+
+def _parallel_walk(path, recursion_depth, scan, workers, ordered):
+    """ Lists directories on a thread pool, which keeps slow file systems such as NFS busy instead of waiting on one listing at a time.
+        Every subdirectory is submitted to the pool as soon as its parent has been listed.
+        If ordered is True the files are yielded in exactly the order _serial_walk yields them,
+        otherwise each directory is yielded as soon as its listing completes.
+    """
+    import concurrent.futures
+    executor = concurrent.futures.ThreadPoolExecutor(max_workers=workers)
+    # Futures that have not been consumed yet, so they can be cancelled if the generator is closed early.
+    pending = set()
+
+    def submit(directory, depth):
+        if logger.isEnabledFor(logging.DEBUG):
+            logger.debug("Scanning directories. Current depth: {depth}. Folder: {folder}.".format(depth=depth, folder=directory))
+        future = executor.submit(scan, directory)
+        pending.add(future)
+        return future, depth
+
+    try:
+        if ordered:
+            stack = [submit(path, 0)]
+            while stack:
+                future, depth = stack.pop()
+                files, directories = future.result()
+                pending.discard(future)
+                if recursion_depth == -1 or depth < recursion_depth:
+                    stack.extend(submit(x, depth + 1) for x in reversed(directories))
+                for entry in files:
+                    yield entry
+        else:
+            depths = dict([submit(path, 0)])
+            while depths:
+                done, _ = concurrent.futures.wait(depths, return_when=concurrent.futures.FIRST_COMPLETED)
+                for future in done:
+                    depth = depths.pop(future)
+                    files, directories = future.result()
+                    pending.discard(future)
+                    if recursion_depth == -1 or depth < recursion_depth:
+                        depths.update(submit(x, depth + 1) for x in directories)
+                    for entry in files:
+                        yield entry
+    finally:
+        # The generator may be closed early, listings that have not started yet are not needed anymore.
+        for future in list(pending):
+            future.cancel()
+        executor.shutdown()
+
+
+def _file_filter(file_suffix, minimum_file_age, maximum_file_age, minimum_file_size=None, maximum_file_size=None):
+    """ Builds the predicate _filter_files applies to each os.DirEntry.
+        All criteria are checked in a single pass, the suffix first as it needs no system call, and the file is stat'ed at most once.
+        The age limits are converted to timestamps once here, so files are compared on the raw st_mtime float.
+    """
+    minimum = minimum_file_age.timestamp() if minimum_file_age else None
+    maximum = maximum_file_age.timestamp() if maximum_file_age else None
+    sized = minimum_file_size is not None or maximum_file_size is not None
+
+    def accept(entry):
+        if file_suffix and not entry.path.endswith(file_suffix):
+            return False
+        if minimum is not None or maximum is not None:
+            modified = entry.stat().st_mtime
+            if minimum is not None and modified > minimum:
+                return False
+            if maximum is not None and modified < maximum:
+                return False
+        if sized:
+            size = entry.stat().st_size
+            if minimum_file_size is not None and size < minimum_file_size:
+                return False
+            if maximum_file_size is not None and size > maximum_file_size:
+                return False
+        return True
+    return accept
+
+
+def _suffix_filter(file_suffix):
+    """ Returns the name_filter for _walk keeping only names ending in file_suffix, None if there is no suffix.
+        A suffix holding a separator, such as b/z.log, spans directories and can not be checked on the name. It is left to the
+        filters, which match the suffix against the whole path.
+    """
+    if not file_suffix or os.sep in file_suffix or (os.altsep and os.altsep in file_suffix):
+        return None
+    return lambda name: name.endswith(file_suffix)
+
+
+def _glob_class_end(pattern, start):
+    """ Returns the position of the ] closing the character class opened by the [ at start, -1 if it is never closed.
+        As in fnmatch a ! or ^ right after the [ negates the class and a ] after that is part of it, so [!] is not a class
+        and an unclosed [ is matched as literal text.
+    """
+    i = start + 1
+    if i < len(pattern) and pattern[i] in '!^':
+        i += 1
+    if i < len(pattern) and pattern[i] == ']':
+        i += 1
+    return pattern.find(']', i)
+
+
+def _glob_regex(pattern):
+    """ Translates a glob to a regular expression. * and ? do not match a /, [...] is a character class,
+        ** as a whole path segment matches any number of directories and a backslash escapes the next character.
+    """
+    result = []
+    i, n = 0, len(pattern)
+    while i < n:
+        c = pattern[i]
+        segment = i == 0 or pattern[i - 1] == '/'
+        if segment and pattern.startswith('**/', i):
+            result.append('(?:.*/)?')
+            i += 3
+        elif segment and pattern.startswith('**', i) and i + 2 == n:
+            result.append('.*')
+            i += 2
+        elif c == '*':
+            result.append('[^/]*')
+            i += 1
+        elif c == '?':
+            result.append('[^/]')
+            i += 1
+        elif c == '[' and _glob_class_end(pattern, i) != -1:
+            end = _glob_class_end(pattern, i)
+            body = pattern[i + 1:end].replace('\\', '\\\\').replace('[', '\\[')
+            if body[0] in '!^':
+                body = '^' + body[1:]
+            result.append('[' + body + ']')
+            i = end + 1
+        elif c == '\\' and i + 1 < n:
+            result.append(re.escape(pattern[i + 1]))
+            i += 2
+        else:
+            result.append(re.escape(c))
+            i += 1
+    return ''.join(result)
+
+
+class _Globs(object):
+    """ A list of glob patterns compiled into a single regular expression.
+        If no pattern holds a / the file or directory name is matched (by_name), otherwise the path relative to the root of the walk,
+        with / as separator. Patterns without a / then match the name at any depth and the others are anchored at the root.
+        negated flags patterns that re-include what an earlier pattern matched, the last matching pattern decides as in .gitignore.
+    """
+    __slots__ = ('by_name', 'match', '_match', '_negated')
+
+    def __init__(self, patterns, negated=()):
+        self.by_name = all('/' not in x for x in patterns)
+        # Alternatives are tried from left to right, so the patterns are reversed to let the last matching one win.
+        # Each is its own group and the only group in it, lastindex tells which one matched.
+        alternatives = []
+        for pattern in reversed(patterns):
+            if self.by_name:
+                alternatives.append('(' + _glob_regex(pattern) + ')')
+            elif '/' in pattern:
+                alternatives.append('(' + _glob_regex(pattern.lstrip('/')) + ')')
+            else:
+                alternatives.append('((?:.*/)?' + _glob_regex(pattern) + ')')
+        self._match = re.compile('|'.join(alternatives), re.DOTALL).fullmatch
+        self._negated = (None,) + tuple(reversed(negated)) if any(negated) else None
+        # Without negated patterns any match decides, match is then the regular expression itself, saving a call per file.
+        self.match = self._match if self._negated is None else self._negated_match
+
+    def _negated_match(self, subject):
+        match = self._match(subject)
+        return match is not None and not self._negated[match.lastindex]
+
+
+class PathFilter(object):
+    """ Include and exclude rules for the find functions, compiled once and checked while directories are listed:
+        an excluded file is never stat'ed or parsed, an excluded directory is never listed.
+        include, exclude and exclude_directories are lists of glob patterns. * and ? match within a path segment, ** matches any
+        number of directories. A pattern without a / matches the name of a file or directory at any depth, a pattern with a /
+        matches the path relative to the path being searched, so /build only matches build directly below it.
+        include keeps only files matching one of its patterns, exclude drops files and exclude_directories drops whole subtrees.
+        With gitignore exclude is read as the lines of a .gitignore file instead: blank lines and # comments are skipped,
+        it applies to directories as well, a trailing / restricts a pattern to directories and ! re-includes what an earlier
+        pattern excluded. As in git a file below an excluded directory can not be re-included.
+    """
+
+    def __init__(self, include=None, exclude=None, exclude_directories=None, gitignore=False):
+        include, exclude, exclude_directories = [self._patterns(x, name) for x, name in
+                                                 [(include, 'include'), (exclude, 'exclude'), (exclude_directories, 'exclude_directories')]]
+        directories = [(x.rstrip('/'), False) for x in exclude_directories]
+        if gitignore:
+            files = []
+            for line in exclude:
+                line = line.rstrip()
+                if not line or line.startswith('#'):
+                    continue
+                negated = line.startswith('!')
+                if negated or line.startswith('\\!') or line.startswith('\\#'):
+                    line = line[1:]
+                if not line.endswith('/'):
+                    files.append((line, negated))
+                directories.append((line.rstrip('/'), negated))
+        else:
+            files = [(x, False) for x in exclude]
+        try:
+            self._include = _Globs(include) if include else None
+            self._exclude = _Globs(*zip(*files)) if files else None
+            self._exclude_directories = _Globs(*zip(*directories)) if directories else None
+        except re.error as error:
+            # Such as a class with a reversed range, [z-a].
+            raise ValueError("invalid pattern: {error}".format(error=error))
+        # Set on the copies sent to the shards of a scan with processes, whose patterns stay relative to the path searched.
+        self._root = None
+
+    @staticmethod
+    def _patterns(patterns, name):
+        if patterns is None:
+            return []
+        if isinstance(patterns, str):
+            return [patterns]
+        if not isinstance(patterns, (list, tuple)) or not all(type(x) is str for x in patterns):
+            raise TypeError("unsupported type for {name}: {current_type} expected 'list' of 'str'".format(name=name, current_type=type(patterns)))
+        return list(patterns)
+
+    @classmethod
+    def from_gitignore(cls, filename, include=None, exclude_directories=None):
+        """ Returns a PathFilter excluding what the .gitignore file filename does, for a search of the directory holding it. """
+        with open(filename) as gitignore:
+            return cls(include, gitignore.read().splitlines(), exclude_directories, gitignore=True)
+
+    def _rooted(self, root):
+        """ Returns a copy of this PathFilter matching paths relative to root whatever path the walk starts at. """
+        rooted = PathFilter.__new__(PathFilter)
+        rooted.__dict__.update(self.__dict__, _root=root)
+        return rooted
+
+    def _bind(self, root, name_filter=None, descend=None):
+        """ Returns the name_filter factory and descend predicate of a walk of root, combined with the name_filter and descend given.
+            The factory is called with each directory listed and returns the name_filter for its files.
+        """
+        prefix = os.path.join(root, '')
+        include, exclude, excluded_directories = self._include, self._exclude, self._exclude_directories
+        include_match = include.match if include is not None else None
+        exclude_match = exclude.match if exclude is not None else None
+
+        def relative(directory):
+            # The path of directory relative to root with / as separator, and a trailing / unless it is root itself.
+            if len(directory) <= len(prefix):
+                return ''
+            return (directory[len(prefix):] + '/').replace(os.sep, '/')
+
+        def accept_in(folder):
+            def accept(name):
+                if name_filter is not None and not name_filter(name):
+                    return False
+                if include_match is not None and not include_match(name if include.by_name else folder + name):
+                    return False
+                return exclude_match is None or not exclude_match(name if exclude.by_name else folder + name)
+            return accept
+
+        if (include is None or include.by_name) and (exclude is None or exclude.by_name):
+            # Only names are matched, the same filter serves every directory.
+            shared = accept_in('')
+
+            def files_in(directory):
+                return shared
+        else:
+            def files_in(directory):
+                return accept_in(relative(directory))
+
+        if excluded_directories is None:
+            return files_in, descend
+
+        def descend_into(directory):
+            subject = directory.rpartition(os.sep)[2] if excluded_directories.by_name else relative(directory)[:-1]
+            if excluded_directories.match(subject):
+                if logger.isEnabledFor(logging.DEBUG):
+                    logger.debug("Skipping {directory}, it is excluded".format(directory=directory))
+                return False
+            return descend is None or descend(directory)
+        return files_in, descend_into
+
+
+def _filter_files(files, file_suffix, minimum_file_age, maximum_file_age, minimum_file_size=None, maximum_file_size=None):
+    """ Lazily filters the os.DirEntry objects in files, yields the path of every file passing all filters. """
+    return (x.path for x in _filter_entries(files, file_suffix, minimum_file_age, maximum_file_age, minimum_file_size, maximum_file_size))
+
+
+def _filter_entries(files, file_suffix, minimum_file_age, maximum_file_age, minimum_file_size, maximum_file_size, stats=None):
+    """ Same as _filter_files but yields the os.DirEntry objects themselves, with their cached stat result. """
+    logger.debug("Starting _filter_files. Suffix: {suffix}, minimum age: {minimum}, maximum age: {maximum}".format(suffix=file_suffix, minimum=minimum_file_age, maximum=maximum_file_age))
+    accept = _file_filter(file_suffix, minimum_file_age, maximum_file_age, minimum_file_size, maximum_file_size)
+    if stats is not None:
+        return stats._filter(files, accept, Stats())
+    return (x for x in files if accept(x))
+
+
+def _scan_shard(function_name, directory, recursion_depth, arguments):
+    """ Runs in a worker process of a scan with processes. Calls the named iter function on one subtree and returns the files
+        found as a single NUL separated bytes buffer, which is far cheaper to send back than a pickled list of str.
+    """
+    files = globals()[function_name](directory, recursion_depth=recursion_depth, **arguments)
+    return b'\0'.join(os.fsencode(x) for x in files)
+
+
+def _sharded(function_name, path, recursion_depth, processes, ordered, descend, arguments):
+    """ Generator behind the processes option of the iter functions.
+        The files directly in path are found in this process, every subdirectory of path is a shard walked by a pool of processes
+        with the named iter function, so CPU bound filtering such as the date regexps runs on several cores.
+        If ordered is True the files are yielded in the same order as without processes, otherwise shard by shard as they finish.
+        descend is applied to the subdirectories of path here, the shards apply it further down themselves.
+        A path_filter in arguments keeps matching paths relative to path in the shards.
+    """
+    path_filter = arguments.get('path_filter')
+    if path_filter is not None:
+        arguments = dict(arguments, path_filter=path_filter._rooted(path))
+        descend = path_filter._bind(path, None, descend)[1]
+    for _file in globals()[function_name](path, recursion_depth=0, **arguments):
+        yield _file
+    if recursion_depth == 0:
+        return
+
+    with os.scandir(path) as scan:
+        directories = [x.path for x in scan if x.is_dir()]
+    if descend is not None:
+        directories = [x for x in directories if descend(x)]
+
+    import concurrent.futures
+    depth = -1 if recursion_depth == -1 else recursion_depth - 1
+    executor = concurrent.futures.ProcessPoolExecutor(max_workers=processes)
+    futures = [executor.submit(_scan_shard, function_name, x, depth, arguments) for x in directories]
+    try:
+        for future in futures if ordered else concurrent.futures.as_completed(futures):
+            found = future.result()
+            if found:
+                for _file in found.split(b'\0'):
+                    yield os.fsdecode(_file)
+    finally:
+        for future in futures:
+            future.cancel()
+        executor.shutdown()
+
+
+class FileSet(object):
+    """ A compact, read only collection of files, for results too large to hold as a list of path strings.
+        Every directory is stored once, in a table, and the file names in a single bytes buffer, so a file costs about 14 bytes
+        plus its encoded name instead of a str of its whole path. Paths are only built when a file is read from the set.
+        files is an iterable of paths, such as iter_files returns. With stat each file is stat'ed once while the set is built
+        and its size and mtime are kept in the sizes and mtimes arrays, which sort and filter work on.
+        Iterating yields the paths in order, set[n] is one path and set[n:m] is a FileSet of the files in that range.
+    """
+    _encoding = sys.getfilesystemencoding()
+    _errors = sys.getfilesystemencodeerrors()
+
+    def __init__(self, files=(), stat=False):
+        self._fill(((x, os.stat(x)) for x in files) if stat else ((x, None) for x in files), stat)
+
+    @classmethod
+    def _from_entries(cls, entries):
+        """ Returns a FileSet with the size and mtime columns of entries, os.DirEntry like objects such as _iter_entries(..., stat=True)
+            yields. Their cached stat result is used, so no file is stat'ed a second time.
+        """
+        fileset = cls.__new__(cls)
+        fileset._fill(((x.path, x.stat()) for x in entries), True)
+        return fileset
+
+    def _fill(self, files, stat):
+        """ Builds the set from files, pairs of a path and its stat result, which is None unless stat is set. """
+        self._directories = []
+        self._buffer = bytearray()
+        self._directory = array.array('I')
+        self._start = array.array('Q')
+        self._length = array.array('H')
+        self.sizes = array.array('q') if stat else None
+        self.mtimes = array.array('d') if stat else None
+
+        # Files arrive directory by directory from the walk, so the directory table is only looked up when the directory changes.
+        directories = {}
+        last = None
+        buffer, encoding, errors = self._buffer, self._encoding, self._errors
+        add_directory, add_start, add_length = self._directory.append, self._start.append, self._length.append
+        for path, result in files:
+            head, separator, name = path.rpartition(os.sep)
+            if head != last or not head:
+                directory = head + separator
+                if directory not in directories:
+                    directories[directory] = len(self._directories)
+                    self._directories.append(directory)
+                last = head
+                index = directories[directory]
+            encoded = name.encode(encoding, errors)
+            add_directory(index)
+            add_start(len(buffer))
+            add_length(len(encoded))
+            buffer += encoded
+            if stat:
+                self.sizes.append(result.st_size)
+                self.mtimes.append(result.st_mtime)
+
+    def _path(self, n):
+        start = self._start[n]
+        return self._directories[self._directory[n]] + self._buffer[start:start + self._length[n]].decode(self._encoding, self._errors)
+
+    def _select(self, rows):
+        """ Returns a FileSet of the files at the positions in rows, sharing the directory table and name buffer with this one. """
+        selected = FileSet.__new__(FileSet)
+        selected._directories = self._directories
+        selected._buffer = self._buffer
+        selected._directory = array.array('I', (self._directory[x] for x in rows))
+        selected._start = array.array('Q', (self._start[x] for x in rows))
+        selected._length = array.array('H', (self._length[x] for x in rows))
+        selected.sizes = array.array('q', (self.sizes[x] for x in rows)) if self.sizes is not None else None
+        selected.mtimes = array.array('d', (self.mtimes[x] for x in rows)) if self.mtimes is not None else None
+        return selected
 
-    if minimum_file_age:
-        logger.debug("Minimum file age provided. Removing all files younger than {date}".format(date=minimum_file_age))
-        minage = [x for x in files if datetime.datetime.fromtimestamp(os.path.getmtime(x)) <= minimum_file_age]
-        files = [x for x in files if x in minage]
+    def __len__(self):
+        return len(self._directory)
 
-    if maximum_file_age:
-        logger.debug("Maximum file age provided. Removing all files older than {date}".format(date=maximum_file_age))
-        maxage = [x for x in files if datetime.datetime.fromtimestamp(os.path.getmtime(x)) >= maximum_file_age]
-        files = [x for x in files if x in maxage]
+    def __iter__(self):
+        for n in range(len(self._directory)):
+            yield self._path(n)
 
-    return files
+    def __getitem__(self, item):
+        if isinstance(item, slice):
+            return self._select(range(*item.indices(len(self))))
+        if item < 0:
+            item += len(self)
+        if not 0 <= item < len(self):
+            raise IndexError("FileSet index out of range")
+        return self._path(item)
 
+    def __repr__(self):
+        return "FileSet(files={files}, directories={directories}, stat={stat})".format(
+            files=len(self), directories=len(self._directories), stat=self.sizes is not None)
 
-def find_files(path, file_suffix=None, recursion_depth=-1, minimum_file_age=None, maximum_file_age=None):
+    def _column(self, name):
+        column = {'size': self.sizes, 'mtime': self.mtimes}[name]
+        if column is None:
+            raise ValueError("the FileSet has no {name} column, create it with stat=True".format(name=name))
+        return column
+
+    def sort(self, key='path', reverse=False):
+        """ Sorts the files in place on key, which is 'path', 'size' or 'mtime'.
+            'path' orders by directory and then by name within it, the other two need the set to be created with stat.
+        """
+        if key == 'path':
+            rank = dict((x, n) for n, x in enumerate(sorted(range(len(self._directories)), key=self._directories.__getitem__)))
+            buffer, start, length, directory = self._buffer, self._start, self._length, self._directory
+            rows = sorted(range(len(self)), key=lambda x: (rank[directory[x]], buffer[start[x]:start[x] + length[x]]), reverse=reverse)
+        else:
+            rows = sorted(range(len(self)), key=self._column(key).__getitem__, reverse=reverse)
+        selected = self._select(rows)
+        self.__dict__.update(selected.__dict__)
+
+    def filter(self, minimum_file_age=None, maximum_file_age=None, minimum_file_size=None, maximum_file_size=None):
+        """ Returns a FileSet of the files passing all the given limits, checked on the columns only.
+            minimum_file_age and maximum_file_age work as for find_files, minimum_file_size and maximum_file_size are inclusive byte counts.
+        """
+        minimum = minimum_file_age.timestamp() if minimum_file_age else None
+        maximum = maximum_file_age.timestamp() if maximum_file_age else None
+        mtimes = self._column('mtime') if minimum is not None or maximum is not None else None
+        sizes = self._column('size') if minimum_file_size is not None or maximum_file_size is not None else None
+        rows = range(len(self))
+        if minimum is not None:
+            rows = [x for x in rows if mtimes[x] <= minimum]
+        if maximum is not None:
+            rows = [x for x in rows if mtimes[x] >= maximum]
+        if minimum_file_size is not None:
+            rows = [x for x in rows if sizes[x] >= minimum_file_size]
+        if maximum_file_size is not None:
+            rows = [x for x in rows if sizes[x] <= maximum_file_size]
+        return self._select(rows)
+
+
+def iter_files(path, file_suffix=None, recursion_depth=-1, minimum_file_age=None, maximum_file_age=None, workers=None, ordered=True, index=None, processes=None,
+               minimum_file_size=None, maximum_file_size=None, stats=None, path_filter=None):
+    """ Same as find_files but returns a generator yielding each file as soon as the walk reaches it.
+        Memory use does not grow with the size of the tree. The input is validated straight away,
+        errors from the file system such as a missing path are raised when the generator is first advanced.
+        """
+    _input_validation(path, file_suffix, recursion_depth, minimum_file_age, maximum_file_age, None, workers, index, None, processes, minimum_file_size, maximum_file_size,
+                      stats, path_filter)
+    if processes:
+        arguments = dict(file_suffix=file_suffix, minimum_file_age=minimum_file_age, maximum_file_age=maximum_file_age, workers=workers, ordered=ordered,
+                         minimum_file_size=minimum_file_size, maximum_file_size=maximum_file_size, path_filter=path_filter)
+        return _sharded('iter_files', path, recursion_depth, processes, ordered, None, arguments)
+    return (x.path for x in _iter_entries(path, file_suffix, recursion_depth, minimum_file_age, maximum_file_age, minimum_file_size, maximum_file_size,
+                                          workers, ordered, index, stats=stats, path_filter=path_filter))
+
+
+def _iter_entries(path, file_suffix, recursion_depth, minimum_file_age, maximum_file_age, minimum_file_size, maximum_file_size, workers, ordered, index, stat=False,
+                  stats=None, path_filter=None):
+    """ The walk and filters behind iter_files, yielding the os.DirEntry of every file passing them.
+        stat makes sure every entry carries its stat result, otherwise files are only stat'ed if a filter needs it.
+    """
+    # The suffix is checked while listing so only the files that pass it are stat'ed, and only if an age or size limit needs it.
+    stat = stat or bool(minimum_file_age or maximum_file_age) or minimum_file_size is not None or maximum_file_size is not None
+    files = _walk(path, recursion_depth, workers, ordered, index, _suffix_filter(file_suffix), stat, stats=stats, path_filter=path_filter)
+    return _filter_entries(files, file_suffix, minimum_file_age, maximum_file_age, minimum_file_size, maximum_file_size, stats)
+
+
+def find_files(path, file_suffix=None, recursion_depth=-1, minimum_file_age=None, maximum_file_age=None, workers=None, ordered=True, index=None, processes=None,
+               minimum_file_size=None, maximum_file_size=None, stats=None, path_filter=None, compact=False):
     """ Locates all files below path
         file_suffix defaults to all files, takes a string in the format of .txt, .csv
         recursion_depth defaults to unlimited, can be changed by supplying a int. 0 = only this folder
         minimum_file_age defaults to None, if set returns only files older than this date.
         maximum_file_age defaults to None, if set returns only files younger than this date.
+        workers defaults to None, if set directories are listed by a pool of this many threads. Useful on network file systems.
+        ordered defaults to True, returning files in the same order with or without workers. False returns them as the listings complete.
+        index defaults to None, if set to a DirectoryIndex only directories that changed since the last scan are listed again.
+        processes defaults to None, if set each subdirectory of path is scanned by a pool of this many processes. Can not be combined with index.
+        compact defaults to False, if set a FileSet holding the same files in a fraction of the memory is returned instead of a list.
+        compact='stat' returns a FileSet with the size and mtime columns, taken from the stat the walk makes of each file.
+        minimum_file_size and maximum_file_size default to None, if set returns only files of at least and at most this many bytes.
+        stats defaults to None, if set to a Stats the counters and timings of the scan are added to it. Can not be combined with processes.
+        path_filter defaults to None, if set to a PathFilter only the files and directories it does not exclude are listed.
         """
-    _input_validation(path, file_suffix, recursion_depth, minimum_file_age, maximum_file_age, None)
+    if compact == 'stat' and not processes:
+        _input_validation(path, file_suffix, recursion_depth, minimum_file_age, maximum_file_age, None, workers, index, None, processes, minimum_file_size,
+                          maximum_file_size, stats, path_filter)
+        return FileSet._from_entries(_iter_entries(path, file_suffix, recursion_depth, minimum_file_age, maximum_file_age, minimum_file_size, maximum_file_size,
+                                                   workers, ordered, index, stat=True, stats=stats, path_filter=path_filter))
+    # The worker processes only send paths back, those files are stat'ed again here.
+    files = iter_files(path, file_suffix, recursion_depth, minimum_file_age, maximum_file_age, workers, ordered, index, processes, minimum_file_size, maximum_file_size,
+                       stats, path_filter)
+    return FileSet(files, stat=compact == 'stat') if compact else list(files)
 
-    # Instead of os.walk we scan folders ourselfs using os.listdir. We then iterate through each folder until maximum recursion depth is reached in each folder.
-    def do_scan(start_dir, recursion_depth, depth=0):
-        logger.debug("Scanning directories. Current depth: {depth}. Folder: {folder}.".format(depth=depth, folder=start_dir))
-        scan = [os.path.join(start_dir, x) for x in os.listdir(start_dir)]
-        found_files = [x for x in scan if os.path.isfile(x)]
 
-        if recursion_depth == -1 or depth < recursion_depth:
-            logger.debug("Maximum recursion depth not reached. Continuing down the file tree.")
-            [found_files.extend(do_scan(x, recursion_depth, depth+1)) for x in scan if os.path.isdir(x)]
-        return found_files
+class DirectoryUsage(object):
+    """ The number of files and their total size in bytes below a directory, as returned by directory_usage. """
+
+    def __init__(self, files=0, bytes=0):
+        self.files = files
+        self.bytes = bytes
+
+    def __repr__(self):
+        return "DirectoryUsage(files={files}, bytes={bytes})".format(files=self.files, bytes=self.bytes)
+
+
+def directory_usage(path, file_suffix=None, recursion_depth=-1, minimum_file_age=None, maximum_file_age=None, minimum_file_size=None, maximum_file_size=None,
+                    workers=None, index=None, stats=None, path_filter=None):
+    """ Returns a dict mapping path and every directory below it with matching files somewhere in its subtree to a DirectoryUsage
+        of those files. The parameters filter as for find_files.
+        Each file is stat'ed once during the walk and only one total per directory is kept, memory does not grow with the number of files.
+    """
+    _input_validation(path, file_suffix, recursion_depth, minimum_file_age, maximum_file_age, None, workers, index, None, None, minimum_file_size, maximum_file_size, stats,
+                      path_filter)
+    root = os.path.dirname(os.path.join(path, ''))
+    usage = {root: DirectoryUsage()}
+    # The walk yields the files of a directory together, so the total is only looked up when the directory changes.
+    last = None
+    for entry in _iter_entries(path, file_suffix, recursion_depth, minimum_file_age, maximum_file_age, minimum_file_size, maximum_file_size,
+                               workers, False, index, stat=True, stats=stats, path_filter=path_filter):
+        prefix = entry.path[:-len(entry.name)]
+        if prefix != last:
+            last = prefix
+            directory = os.path.dirname(entry.path)
+            total = usage.get(directory)
+            if total is None:
+                total = usage[directory] = DirectoryUsage()
+        total.files += 1
+        total.bytes += entry.stat().st_size
+
+    # The totals so far only hold the files directly in each directory. Directories between those and path are added,
+    # then every total is added to its parent, deepest first, so each ends up holding its whole subtree.
+    for directory in list(usage):
+        while directory != root:
+            directory = os.path.dirname(directory)
+            if directory in usage:
+                break
+            usage[directory] = DirectoryUsage()
+    for directory in sorted(usage, key=lambda x: x.count(os.sep), reverse=True):
+        if directory != root:
+            parent = usage[os.path.dirname(directory)]
+            parent.files += usage[directory].files
+            parent.bytes += usage[directory].bytes
+    return usage
 
-    found_files = do_scan(path, recursion_depth)
-    logger.debug("All files found before filter is applied: {files}".format(files=found_files))
-    return _filter_files(found_files, file_suffix, minimum_file_age, maximum_file_age)
+
+def largest_files(path, count, file_suffix=None, recursion_depth=-1, minimum_file_age=None, maximum_file_age=None, minimum_file_size=None, maximum_file_size=None,
+                  workers=None, index=None, stats=None, path_filter=None):
+    """ Returns the count largest files below path as a list of (path, size in bytes), largest first. The other parameters filter as for find_files.
+        The files are kept in a heap of count entries during the walk, memory does not grow with the number of files.
+    """
+    _input_validation(path, file_suffix, recursion_depth, minimum_file_age, maximum_file_age, None, workers, index, None, None, minimum_file_size, maximum_file_size, stats,
+                      path_filter)
+    entries = _iter_entries(path, file_suffix, recursion_depth, minimum_file_age, maximum_file_age, minimum_file_size, maximum_file_size,
+                            workers, False, index, stat=True, stats=stats, path_filter=path_filter)
+    sizes = ((x.stat().st_size, x.path) for x in entries)
+    return [(x, y) for y, x in heapq.nlargest(count, sizes)]
+
+
+def oldest_files(path, count, file_suffix=None, recursion_depth=-1, minimum_file_age=None, maximum_file_age=None, minimum_file_size=None, maximum_file_size=None,
+                 workers=None, index=None, stats=None, path_filter=None):
+    """ Returns the count least recently modified files below path as a list of (path, mtime as datetime), oldest first.
+        The other parameters filter as for find_files. The files are kept in a heap of count entries during the walk.
+    """
+    _input_validation(path, file_suffix, recursion_depth, minimum_file_age, maximum_file_age, None, workers, index, None, None, minimum_file_size, maximum_file_size, stats,
+                      path_filter)
+    entries = _iter_entries(path, file_suffix, recursion_depth, minimum_file_age, maximum_file_age, minimum_file_size, maximum_file_size,
+                            workers, False, index, stat=True, stats=stats, path_filter=path_filter)
+    mtimes = ((x.stat().st_mtime, x.path) for x in entries)
+    return [(x, datetime.datetime.fromtimestamp(y)) for y, x in heapq.nsmallest(count, mtimes)]
 
 
 def _determine_dates(year, month, date, hour, minutes, seconds, miliseconds):
         logger.debug("Starting trying to determine date")
-        month = month.lower()
-        if 'jan' in month:
-            month = 1
-        elif 'feb' in month:
-            month = 2
-        elif 'mar' in month:
-            month = 3
-        elif 'apr' in month:
-            month = 4
-        elif month == 'may':
-            month = 5
-        elif 'jun' in month:
-            month = 6
-        elif 'jul' in month:
-            month = 7
-        elif 'aug' in month:
-            month = 8
-        elif 'sep' in month:
-            month = 9
-        elif 'oct' in month:
-            month = 10
-        elif 'nov' in month:
-            month = 11
-        elif 'dec' in month:
-            month = 12
+        month = _MONTHS.get(month[:3].lower(), month)
 
         year = int(year)
         month = int(month)
@@ -176,89 +1359,508 @@ def _determine_dates(year, month, date, hour, minutes, seconds, miliseconds):
         return datetime.datetime(year, month, date, hour, minutes, seconds, miliseconds)
 
 
-def _filter_datetime_named_files(files, file_suffix, minimum_file_age, maximum_file_age, regexp):
-    if file_suffix:
-        logger.debug("File suffix provided. Removing all files not matching {suffix}".format(suffix=file_suffix))
-        suffix = [x for x in files if x.endswith(file_suffix)]
-        files = [x for x in files if x in suffix]
+def _match_date(name, regexp=None, stats=None):
+    """ Returns the datetime found in name by the first of the compiled regexps that matches, None if no date was found.
+        Without regexp the default date regexps are used. The searches made are counted in stats if given.
+    """
+    searched = 0
+    if regexp is None:
+        searched = 1
+        if not _DIGIT_RUN.search(name):
+            if stats is not None:
+                stats.regex_evaluations += searched
+            return None
+        regexp = _date_regexps()
+    for tried, reg in enumerate(regexp, 1):
+        result = reg.search(name)
+        if result:
+            if stats is not None:
+                stats.regex_evaluations += searched + tried
+            # Creating the datetime object. If the object contained group 4-7 it was provided in a Javascript timestamp format such as : 2010-10-10T10:10:10.100
+            groups = result.groups()[:7]
+            return _determine_dates(*(groups + (0,) * (7 - len(groups))))
+    if stats is not None:
+        stats.regex_evaluations += searched + len(regexp)
+    return None
+
+
+# A directory whose path ends in yyyy, yyyy/mm or yyyy/mm/dd. Only the trailing segments count, so a year further up the path
+# is not mistaken for the date of the directories below a dated one. Years are limited to 1900-2099, other four digit names
+# such as 1024 or 8080 are too common to prune on.
+_DATE_DIRECTORY_REGEXP = re.compile(r'(?:^|/)((?:19|20)[0-9]{2})(?:/([0-9]{1,2})(?:/([0-9]{1,2}))?)?$')
+
+
+def _directory_date_range(directory, regexp):
+    """ Returns the (start, end) datetimes a dated directory covers, end exclusive, or None if directory carries no date.
+        regexp is searched in the path with / as separator, its groups are the year and optionally the month and the day.
+        Month names are recognised like in file names and two digit years are expanded the same way.
+    """
+    result = regexp.search(directory.replace(os.sep, '/'))
+    if not result:
+        return None
+    groups = result.groups() + (None, None)
+    try:
+        year = int(groups[0])
+        if year < 1000:
+            year += 1900 if year > 50 else 2000
+        if groups[1] is None:
+            return datetime.datetime(year, 1, 1), datetime.datetime(year + 1, 1, 1)
+        month = int(_MONTHS.get(groups[1][:3].lower(), groups[1]))
+        if groups[2] is None:
+            start = datetime.datetime(year, month, 1)
+            return start, (start + datetime.timedelta(days=31)).replace(day=1)
+        start = datetime.datetime(year, month, int(groups[2]))
+        return start, start + datetime.timedelta(days=1)
+    except ValueError:
+        logger.debug("{directory} looks dated but is not a valid date".format(directory=directory))
+        return None
+
+
+def _date_directory_filter(minimum_file_age, maximum_file_age, directory_regexp):
+    """ Builds the descend predicate for _walk skipping dated directories whose whole date range is outside the age limits.
+        Returns None when there are no limits to prune on.
+    """
+    if not minimum_file_age and not maximum_file_age:
+        return None
+    regexp = _compile_groups(directory_regexp, 1, 'directory_regexp') if directory_regexp else _DATE_DIRECTORY_REGEXP
+
+    def descend(directory):
+        dates = _directory_date_range(directory, regexp)
+        if dates is None:
+            return True
+        start, end = dates
+        if minimum_file_age and start > minimum_file_age or maximum_file_age and end <= maximum_file_age:
+            if logger.isEnabledFor(logging.DEBUG):
+                logger.debug("Skipping {directory}, its dates are outside the scope".format(directory=directory))
+            return False
+        return True
+    return descend
+
+
+def _datetime_filter(file_suffix, minimum_file_age, maximum_file_age, regexp, stats=None):
+    """ Builds the predicate _filter_datetime_named_files applies to each os.DirEntry.
+        All criteria are checked in a single pass and the name is parsed at most once per file.
+    """
+    # Checked once per scan, the messages below would otherwise be formatted for every file even with debug logging off.
+    debug = logger.isEnabledFor(logging.DEBUG)
+
+    def accept(entry):
+        if file_suffix and not entry.path.endswith(file_suffix):
+            return False
+        _file_date = _match_date(entry.name, regexp, stats)
+        if _file_date is None:
+            if debug:
+                logger.debug("Unable to determine date for {_file}. Filtering it out.".format(_file=entry.path))
+            return False
+        if debug:
+            logger.debug("Datetime for {_file} is {_date}".format(_file=entry.path, _date=_file_date))
+        if minimum_file_age and _file_date > minimum_file_age or maximum_file_age and _file_date < maximum_file_age:
+            if debug:
+                logger.debug("Minimum age or Maximum age provided and file: {_file} is out side the scope".format(_file=entry.path))
+            return False
+        return True
+    return accept
 
+
+def _filter_datetime_named_files(files, file_suffix, minimum_file_age, maximum_file_age, regexp, stats=None):
+    """ Lazily filters the os.DirEntry objects in files on the date found in their name, yields the path of every file passing all filters. """
     if not regexp:
         logger.debug("No custom regexp provided. Using existing regexps")
-        regexp = [
-            r'([0-9]{4})[\-\.\_\ ]?([0-9]{1,2})[\-\.\_\ ]?([0-9]{1,2})',                                                                                # yyyy-mm-dd
-            r'([0-9]{2})[\-\.\_\ ]?(Jan|Feb|Mar|Apr|May|Jun|Jul|Aug|Sep|Oct|Nov|Dec)[\-\.\_\ ]?([0-9]{1,2})',                                           # yyMondd
-            r'([0-9]{4})[\-\.\_\ ]?(Jan|Feb|Mar|Apr|May|Jun|Jul|Aug|Sep|Oct|Nov|Dec)[\-\.\_\ ]?([0-9]{1,2})',                                           # yyyyMondd
-            r'([0-9]{2})[\-\.\_\ ]?(jan|feb|mar|apr|may|jun|jul|aug|sep|oct|nov|dec)[\-\.\_\ ]?([0-9]{1,2})',                                           # yymondd
-            r'([0-9]{4})[\-\.\_\ ]?(jan|feb|mar|apr|may|jun|jul|aug|sep|oct|nov|dec)[\-\.\_\ ]?([0-9]{1,2})',                                           # yyyymondd
-            r'([0-9]{4})[\-\.\_\ ]?(Januari|February|March|April|May|June|July|August|September|October|November|December)[\-\.\_\ ]?([0-9]{1,2})',     # yyyyMondd
-            r'([0-9]{2})[\-\.\_\ ]?(Januari|February|March|April|May|June|July|August|September|October|November|December)[\-\.\_\ ]?([0-9]{1,2})',     # yyMondd
-            r'([0-9]{4})[\-\.\_\ ]?(januari|february|march|april|may|june|july|august|september|october|november|decemeber)[\-\.\_\ ]?([0-9]{1,2})',    # yyyymondd
-            r'([0-9]{2})[\-\.\_\ ]?(januari|february|march|april|may|june|july|august|september|october|november|decemeber)[\-\.\_\ ]?([0-9]{1,2})',    # yymondd
-            r'([0-9]{4})\-([0-9]{2})\-([0-9]{2})\T([0-9]{2})\:([0-9]{2})\:([0-9]{2})\.([0-9]{3})',                                                      # Javascript
-        ]
-        logger.debug("Existing regexps: {regexp}".format(regexp=regexp))
-        regexp = [re.compile(x) for x in regexp]
+        regexp = None
 
     else:
         logger.debug("Custom regexp provided, compiling: {regexp}".format(regexp=regexp))
-        regexp = [re.compile(regexp)]
-
-    to_be_filtered = []
-    for _file in files:
-        name = _file.split('/')[-1]
-        for reg in regexp:
-            result = re.search(reg, name)
-            if result:
-                # Creating the datetime object. If the object contained group 4-7 it was provided in a Javascript timestamp format such as : 2010-10-10T10:10:10.100
-                logger.debug("Creating datetime obj for {_file}".format(_file=_file))
-                _file_date = _determine_dates(
-                    (result.group(1) if len(result.groups()) >= 1 else 0),
-                    (result.group(2) if len(result.groups()) >= 2 else 0),
-                    (result.group(3) if len(result.groups()) >= 3 else 0),
-                    (result.group(4) if len(result.groups()) >= 4 else 0),
-                    (result.group(5) if len(result.groups()) >= 5 else 0),
-                    (result.group(6) if len(result.groups()) >= 6 else 0),
-                    (result.group(7) if len(result.groups()) >= 7 else 0)
-                    )
-                logger.debug("Datetime for {_file} is {_date}".format(_file=_file, _date=_file_date))
-
-                if minimum_file_age and _file_date > minimum_file_age or maximum_file_age and _file_date < maximum_file_age:
-                    logger.debug("Minimum age or Maximum age provided and file: {_file} is out side the scope".format(_file=_file))
-                    to_be_filtered.append(_file)
-
-                break
+        regexp = [_compile_groups(regexp, 3, 'regexp')]
 
-        else:
-            logger.debug("Unable to determine date for {_file}. Adding it to the list of files should be filtered out.".format(_file=_file))
-            to_be_filtered.append(_file)
+    # The regexp searches are counted on the scan's own tally, like the rest of the filtering.
+    tally = Stats() if stats is not None else None
+    accept = _datetime_filter(file_suffix, minimum_file_age, maximum_file_age, regexp, tally)
+    if stats is not None:
+        return (x.path for x in stats._filter(files, accept, tally))
+    return (x.path for x in files if accept(x))
 
-    for _file in to_be_filtered:
-        if _file in files:
-            files.remove(_file)
 
-    return files
+def iter_datetime_named_files(path, file_suffix=None, recursion_depth=-1, minimum_file_age=None, maximum_file_age=None, regexp=None, workers=None, ordered=True, index=None,
+                              prune_directories=False, directory_regexp=None, processes=None, stats=None, path_filter=None):
+    """ Same as find_datetime_named_files but returns a generator yielding each file as soon as the walk reaches it.
+    Memory use does not grow with the size of the tree. The input is validated straight away,
+    errors from the file system such as a missing path are raised when the generator is first advanced.
+    """
+    _input_validation(path, file_suffix, recursion_depth, minimum_file_age, maximum_file_age, regexp, workers, index, directory_regexp, processes, stats=stats,
+                      path_filter=path_filter)
+    descend = _date_directory_filter(minimum_file_age, maximum_file_age, directory_regexp) if prune_directories or directory_regexp else None
+    if processes:
+        arguments = dict(file_suffix=file_suffix, minimum_file_age=minimum_file_age, maximum_file_age=maximum_file_age, regexp=regexp, workers=workers,
+                         ordered=ordered, prune_directories=prune_directories, directory_regexp=directory_regexp, path_filter=path_filter)
+        return _sharded('iter_datetime_named_files', path, recursion_depth, processes, ordered, descend, arguments)
+    files = _walk(path, recursion_depth, workers, ordered, index, _suffix_filter(file_suffix), descend=descend, stats=stats, path_filter=path_filter)
+    return _filter_datetime_named_files(files, file_suffix, minimum_file_age, maximum_file_age, regexp, stats)
 
 
-def find_datetime_named_files(path, file_suffix=None, recursion_depth=-1, minimum_file_age=None, maximum_file_age=None, regexp=None):
+def find_datetime_named_files(path, file_suffix=None, recursion_depth=-1, minimum_file_age=None, maximum_file_age=None, regexp=None, workers=None, ordered=True, index=None,
+                              prune_directories=False, directory_regexp=None, processes=None, stats=None, path_filter=None, compact=False):
     """ Locates all files below path
     file_suffix if provided all files not ending with this pattern will be filtered out.
     recursion_depth defaults to unlimited, if provided will only look n folders deep for files.
     minimum_file_age defaults to None, if set returns only files older than this date.
     maximum_file_age defaults to None, if set returns only files younger than this date.
-    regexp, will use own list of date regexps if none provided.
+    regexp, will use own list of date regexps if none provided. Its groups are the year, month and day, ValueError is raised if it has fewer than three.
+    workers defaults to None, if set directories are listed by a pool of this many threads. Useful on network file systems.
+    ordered defaults to True, returning files in the same order with or without workers. False returns them as the listings complete.
+    index defaults to None, if set to a DirectoryIndex only directories that changed since the last scan are listed again.
+    prune_directories defaults to False, if set directories laid out as yyyy/mm/dd whose dates are all outside the age limits are not entered.
+    directory_regexp, will use the yyyy/mm/dd layout with years 1900 to 2099 if none provided. Groups are year, month and day, the year one at least, setting it enables prune_directories.
+    processes defaults to None, if set each subdirectory of path is scanned by a pool of this many processes. Can not be combined with index.
+    compact defaults to False, if set a FileSet holding the same files in a fraction of the memory is returned instead of a list.
+    compact='stat' returns a FileSet with the size and mtime columns, the only stat made of the files as the date filter needs none.
+    stats defaults to None, if set to a Stats the counters and timings of the scan are added to it. Can not be combined with processes.
+    path_filter defaults to None, if set to a PathFilter only the files and directories it does not exclude are listed.
     """
-    _input_validation(path, file_suffix, recursion_depth, minimum_file_age, maximum_file_age, regexp)
+    files = iter_datetime_named_files(path, file_suffix, recursion_depth, minimum_file_age, maximum_file_age, regexp, workers, ordered, index,
+                                      prune_directories, directory_regexp, processes, stats, path_filter)
+    return FileSet(files, stat=compact == 'stat') if compact else list(files)
 
-    def do_scan(start_dir, recursion_depth, depth=0):
-        logger.debug("Scanning directories. Current depth: {depth}. Folder: {folder}.".format(depth=depth, folder=start_dir))
-        scan = [os.path.join(start_dir, x) for x in os.listdir(start_dir)]
-        found_files = [x for x in scan if os.path.isfile(x)]
 
-        if recursion_depth == -1 or depth < recursion_depth:
-            logger.debug("Maximum recursion depth not reached. Continuing down the file tree.")
-            [found_files.extend(do_scan(x, recursion_depth, depth+1)) for x in scan if os.path.isdir(x)]
-        return found_files
+class RetentionPlan(object):
+    """ Which files retention_plan keeps and which it would delete.
+        keep and delete hold the paths of the files a date was found in, newest first, delete can be passed straight to delete_files.
+        undated holds the files no date was found in, they are left out of both and never selected for deletion.
+    """
+
+    def __init__(self):
+        self.keep = []
+        self.delete = []
+        self.undated = []
+
+    def __repr__(self):
+        return "RetentionPlan(keep={keep}, delete={delete}, undated={undated})".format(keep=len(self.keep), delete=len(self.delete), undated=len(self.undated))
+
+
+# The periods retention_plan keeps one file for, as the key of the period a date falls in.
+_RETENTION_PERIODS = [
+    ('keep_daily', lambda x: (x.year, x.month, x.day)),
+    ('keep_weekly', lambda x: x.isocalendar()[:2]),
+    ('keep_monthly', lambda x: (x.year, x.month)),
+    ('keep_yearly', lambda x: x.year),
+]
+
+
+def retention_plan(files, keep_last=0, keep_daily=0, keep_weekly=0, keep_monthly=0, keep_yearly=0, regexp=None, stats=None):
+    """ Decides which of files to keep for a backup rotation, from the date in each file name. Returns a RetentionPlan.
+        files is an iterable of paths, such as find_datetime_named_files returns. regexp works as for find_datetime_named_files.
+        keep_last keeps the newest keep_last files. keep_daily keeps the newest file of each of the keep_daily most recent days
+        that have a file, keep_weekly, keep_monthly and keep_yearly do the same for ISO weeks, months and years.
+        A file is kept if any of the rules keeps it, every rule counts its periods on its own.
+        The names are parsed once and the files sorted once, newest first, all rules are then applied in a single pass.
+        The regexp searches are counted in stats if given.
+    """
+    for name, value in [('keep_last', keep_last), ('keep_daily', keep_daily), ('keep_weekly', keep_weekly), ('keep_monthly', keep_monthly), ('keep_yearly', keep_yearly)]:
+        if type(value) is not int:
+            raise TypeError("unsupported type for {name}: {current_type} expected 'int'".format(name=name, current_type=type(value)))
+    if regexp and type(regexp) is not str:
+        raise TypeError("unsupported type for regexp: {current_type} expected 'str'".format(current_type=type(regexp)))
+
+    regexp = [_compile_groups(regexp, 3, 'regexp')] if regexp else None
+    tally = Stats() if stats is not None else None
+    plan = RetentionPlan()
+    dated = []
+    for path in files:
+        _file_date = _match_date(os.path.basename(path), regexp, tally)
+        if _file_date is None:
+            plan.undated.append(path)
+        else:
+            dated.append((_file_date, path))
+    if stats is not None:
+        stats._merge(tally)
+    dated.sort(reverse=True)
+
+    counts = {'keep_daily': keep_daily, 'keep_weekly': keep_weekly, 'keep_monthly': keep_monthly, 'keep_yearly': keep_yearly}
+    # Each rule remembers the periods it has kept a file for, once it holds as many as it may keep it is done.
+    rules = [(counts[name], period, set()) for name, period in _RETENTION_PERIODS if counts[name] > 0]
+    for n, (_file_date, path) in enumerate(dated):
+        keep = n < keep_last
+        for count, period, kept in rules:
+            if len(kept) < count:
+                key = period(_file_date)
+                if key not in kept:
+                    kept.add(key)
+                    keep = True
+        (plan.keep if keep else plan.delete).append(path)
+    logger.debug("Retention plan: {plan}".format(plan=plan))
+    return plan
+
+
+# The async API below runs the blocking scandir, stat and remove calls on the event loop's default executor, a batch at a time,
+# so the loop is only ever blocked for the time it takes to hand over a batch.
+_ASYNC_BATCH_SIZE = 1000
+
+
+def _next_batch(files, size):
+    """ Reads up to size items from the iterator files. """
+    batch = []
+    for _file in files:
+        batch.append(_file)
+        if len(batch) == size:
+            break
+    return batch
+
+
+async def _run_blocking(semaphore, function, *args):
+    """ Runs function on the default executor, holding semaphore while it runs if one is given. """
+    import asyncio
+    loop = asyncio.get_running_loop()
+    if semaphore is None:
+        return await loop.run_in_executor(None, function, *args)
+    async with semaphore:
+        return await loop.run_in_executor(None, function, *args)
+
+
+async def _iterate_async(files, batch_size, semaphore):
+    """ Async generator over the synchronous generator files, advancing it batch_size files at a time on the executor. """
+    try:
+        while True:
+            batch = await _run_blocking(semaphore, _next_batch, files, batch_size)
+            if not batch:
+                break
+            for _file in batch:
+                yield _file
+    finally:
+        try:
+            files.close()
+        except ValueError:
+            # A cancelled batch is still advancing the generator on the executor, it is closed once garbage collected instead.
+            pass
+
+
+def async_find_files(path, file_suffix=None, recursion_depth=-1, minimum_file_age=None, maximum_file_age=None, workers=None, ordered=True, index=None,
+                     processes=None, minimum_file_size=None, maximum_file_size=None, stats=None, path_filter=None, batch_size=_ASYNC_BATCH_SIZE, semaphore=None):
+    """ Same as iter_files but returns an async iterator, use it with async for.
+        The walk runs on the event loop's default executor batch_size files at a time, so other tasks keep running during a scan.
+        semaphore defaults to None, if set to an asyncio.Semaphore a batch is only read while holding it. Share one between
+        scans of many roots to bound how many of them occupy the executor at once.
+    """
+    files = iter_files(path, file_suffix, recursion_depth, minimum_file_age, maximum_file_age, workers, ordered, index, processes, minimum_file_size, maximum_file_size,
+                       stats, path_filter)
+    return _iterate_async(files, batch_size, semaphore)
+
+
+def async_find_datetime_named_files(path, file_suffix=None, recursion_depth=-1, minimum_file_age=None, maximum_file_age=None, regexp=None, workers=None, ordered=True,
+                                    index=None, prune_directories=False, directory_regexp=None, processes=None, stats=None, path_filter=None,
+                                    batch_size=_ASYNC_BATCH_SIZE, semaphore=None):
+    """ Same as iter_datetime_named_files but returns an async iterator, use it with async for.
+    batch_size and semaphore work as for async_find_files.
+    """
+    return _iterate_async(
+        iter_datetime_named_files(path, file_suffix, recursion_depth, minimum_file_age, maximum_file_age, regexp, workers, ordered, index,
+                                  prune_directories, directory_regexp, processes, stats, path_filter),
+        batch_size, semaphore)
+
+
+async def _async_batches(files, size):
+    """ Splits a sync or async iterable of files into lists of at most size files. """
+    if not hasattr(files, '__aiter__'):
+        for batch in _batches(files, size):
+            yield batch
+        return
+    batch = []
+    async for _file in files:
+        batch.append(_file)
+        if len(batch) == size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+
+def _raise_first(results):
+    """ Raises the first exception in results, the outcomes of finished tasks. Every task's exception has been retrieved by then. """
+    for result in results:
+        if isinstance(result, BaseException):
+            raise result
+
+
+async def async_delete_files(files, directory_delete=False, dry_run=False, continue_on_error=False, root=None, concurrency=4, semaphore=None, stats=None):
+    """ Same as delete_files but a coroutine. files can be any iterable or async iterable, such as the result of async_find_files.
+    Batches of files are removed on the event loop's default executor, at most concurrency batches at a time, one at a time if it is 0 or None.
+    semaphore works as for async_find_files and is held for every batch. stats works as for delete_files.
+    Returns a DeletionReport.
+    """
+    import asyncio
+    report = DeletionReport(dry_run)
+    removed = {}
+    # 0 removes the batches one at a time, like workers=0 does for delete_files, instead of never acquiring the semaphore.
+    limit = asyncio.Semaphore(concurrency or 1)
+    tasks = set()
+
+    async def delete(batch):
+        try:
+            _collect_deleted(await _run_blocking(semaphore, _delete_batch, batch, dry_run, continue_on_error, stats), directory_delete, report, removed)
+        finally:
+            limit.release()
+
+    try:
+        async for batch in _async_batches(files, _DELETE_BATCH_SIZE):
+            await limit.acquire()
+            tasks.add(asyncio.ensure_future(delete(batch)))
+            # Finished tasks are collected as we go so a failed batch stops the deletion early.
+            done = set(x for x in tasks if x.done())
+            tasks -= done
+            _raise_first([x.exception() for x in done])
+        if tasks:
+            results = await asyncio.gather(*tasks, return_exceptions=True)
+            tasks = set()
+            _raise_first(results)
+    finally:
+        for task in tasks:
+            task.cancel()
+        if tasks:
+            # Awaited so the exceptions of batches that failed meanwhile are retrieved instead of logged as never retrieved.
+            await asyncio.gather(*tasks, return_exceptions=True)
+
+    if directory_delete:
+        await _run_blocking(semaphore, _delete_directories, removed, root, dry_run, continue_on_error, report)
+    if stats is not None:
+        _count_deleted(stats, report)
+    return report
+
+
+def _read_paths(stream, separator):
+    """ Yields the paths in the binary stream as they arrive, separated by separator. Empty paths are skipped. """
+    rest = b''
+    for chunk in iter(lambda: stream.read1(65536), b''):
+        paths = (rest + chunk).split(separator)
+        rest = paths.pop()
+        for path in paths:
+            if path:
+                yield os.fsdecode(path)
+    if rest:
+        yield os.fsdecode(rest)
+
+
+def _write_paths(files, stream, print0=False, json_lines=False):
+    """ Writes each path to the binary stream as soon as files yields it, NUL terminated with print0,
+        as a {"path": ...} JSON object per line with json_lines and newline terminated otherwise.
+    """
+    if json_lines:
+        import json
+        for path in files:
+            stream.write(json.dumps({'path': path}).encode() + b'\n')
+    else:
+        terminator = b'\0' if print0 else b'\n'
+        for path in files:
+            stream.write(os.fsencode(path) + terminator)
+
+
+def main(argv=None):
+    """ The fileutility command line tool. Returns the exit status, 0 on success and 1 if anything failed.
+        fileutility find and fileutility find-dated stream the files found by iter_files and iter_datetime_named_files to stdout.
+        fileutility delete removes the files given as arguments, or read from stdin, with delete_files and prints the report.
+    """
+    import argparse
+
+    def age(value):
+        # A number of days before now, or an ISO date such as 2018-08-17 or 2018-08-17T10:00:00.
+        try:
+            return datetime.datetime.now() - datetime.timedelta(days=float(value))
+        except ValueError:
+            return datetime.datetime.strptime(value, '%Y-%m-%dT%H:%M:%S' if 'T' in value else '%Y-%m-%d')
+
+    parser = argparse.ArgumentParser(prog='fileutility', description='Locate and delete files and folders.')
+    commands = parser.add_subparsers(dest='command', metavar='command')
+    commands.required = True
+
+    finders = []
+    for name, text in [('find', 'list files, filtered on their suffix and mtime'),
+                       ('find-dated', 'list files, filtered on their suffix and the date in their name')]:
+        finder = commands.add_parser(name, help=text, description=text)
+        finder.add_argument('path')
+        finder.add_argument('--suffix', dest='file_suffix', metavar='SUFFIX', help='only files ending in SUFFIX, e.g. .tar.gz')
+        finder.add_argument('--depth', dest='recursion_depth', type=int, default=-1, metavar='N', help='levels of subdirectories to descend, 0 for path only')
+        finder.add_argument('--older-than', dest='minimum_file_age', type=age, metavar='DATE', help='a date such as 2018-08-17 or a number of days ago')
+        finder.add_argument('--newer-than', dest='maximum_file_age', type=age, metavar='DATE', help='a date such as 2018-08-17 or a number of days ago')
+        finder.add_argument('--workers', type=int, metavar='N', help='list directories on this many threads')
+        finder.add_argument('--unordered', dest='ordered', action='store_false', help='with workers or processes, print files as they are found')
+        finder.add_argument('--processes', type=int, metavar='N', help='scan the subdirectories of path in this many processes')
+        finder.add_argument('--index', metavar='DATABASE', help='keep a DirectoryIndex of the tree in DATABASE')
+        finder.add_argument('--include', action='append', metavar='GLOB', help='only files matching GLOB, may be repeated')
+        finder.add_argument('--exclude', action='append', metavar='GLOB', help='skip files matching GLOB, may be repeated')
+        finder.add_argument('--exclude-dir', dest='exclude_directories', action='append', metavar='GLOB',
+                            help='do not descend into directories matching GLOB, may be repeated')
+        finder.add_argument('--gitignore', metavar='FILE', help='skip what the .gitignore file FILE ignores, --exclude uses its syntax as well')
+        output = finder.add_mutually_exclusive_group()
+        output.add_argument('-0', '--print0', '-print0', dest='print0', action='store_true', help='terminate each path with NUL, for xargs -0')
+        output.add_argument('--json', dest='json_lines', action='store_true', help='print a JSON object per path')
+        finder.add_argument('--stats', action='store_true', help='print the Stats of the scan as a JSON object to stderr')
+        finders.append(finder)
+    finders[0].add_argument('--min-size', dest='minimum_file_size', type=int, metavar='BYTES', help='only files of at least BYTES')
+    finders[0].add_argument('--max-size', dest='maximum_file_size', type=int, metavar='BYTES', help='only files of at most BYTES')
+    finders[1].add_argument('--regexp', help='regexp whose groups are the year, month and day in a file name')
+    finders[1].add_argument('--prune-directories', action='store_true', help='skip dated yyyy/mm/dd directories outside the age limits')
+    finders[1].add_argument('--directory-regexp', metavar='REGEXP', help='regexp whose groups are the year, month and day of a dated directory')
+
+    deleter = commands.add_parser('delete', help='delete files', description='Delete the files given, or read from stdin one per line.')
+    deleter.add_argument('files', nargs='*', metavar='file')
+    deleter.add_argument('-0', '--null', action='store_true', help='paths on stdin are terminated by NUL, as from find -print0')
+    deleter.add_argument('--directory-delete', action='store_true', help='also remove the directories left empty')
+    deleter.add_argument('--root', help='with --directory-delete, prune every empty directory below ROOT')
+    deleter.add_argument('--workers', type=int, metavar='N', help='delete on this many threads')
+    deleter.add_argument('--dry-run', action='store_true', help='remove nothing, report what would be removed')
+    deleter.add_argument('--continue-on-error', action='store_true', help='report errors and carry on instead of stopping at the first')
+    deleter.add_argument('--json', dest='json_lines', action='store_true', help='print the report as a JSON object')
+    deleter.add_argument('--stats', action='store_true', help='print the Stats of the deletion as a JSON object to stderr')
+
+    arguments = vars(parser.parse_args(argv))
+    command = arguments.pop('command')
+    stats = arguments['stats'] = Stats() if arguments['stats'] else None
+    try:
+        if command == 'delete':
+            status = _delete_command(**arguments)
+        else:
+            print0 = arguments.pop('print0')
+            json_lines = arguments.pop('json_lines')
+            index = arguments.pop('index')
+            include, exclude, exclude_directories, gitignore = [arguments.pop(x) for x in ['include', 'exclude', 'exclude_directories', 'gitignore']]
+            if gitignore:
+                with open(gitignore) as lines:
+                    exclude = lines.read().splitlines() + (exclude or [])
+            if include or exclude or exclude_directories:
+                arguments['path_filter'] = PathFilter(include, exclude, exclude_directories, gitignore=bool(gitignore))
+            with (DirectoryIndex(index) if index else contextlib.nullcontext()) as index:
+                files = (iter_files if command == 'find' else iter_datetime_named_files)(index=index, **arguments)
+                _write_paths(files, sys.stdout.buffer, print0, json_lines)
+                sys.stdout.flush()
+            status = 0
+    except BrokenPipeError:
+        # The reader, such as head, went away. Point stdout at devnull so the flush at exit does not complain again.
+        os.dup2(os.open(os.devnull, os.O_WRONLY), sys.stdout.fileno())
+        return 1
+    except (OSError, ValueError, re.error) as error:
+        # re.error covers a --regexp or --directory-regexp that does not compile, ValueError one without enough groups.
+        sys.stderr.write("fileutility: {error}\n".format(error=error))
+        return 1
+    if stats is not None:
+        import json
+        sys.stderr.write(json.dumps(stats.as_dict()) + '\n')
+    return status
+
+
+def _delete_command(files, null, json_lines, **arguments):
+    """ fileutility delete, see main. """
+    if not files:
+        files = _read_paths(sys.stdin.buffer, b'\0' if null else b'\n')
+    report = delete_files(files, **arguments)
+    for path, error in report.errors:
+        sys.stderr.write("fileutility: {error}\n".format(error=error))
+    if json_lines:
+        import json
+        print(json.dumps({'dry_run': report.dry_run, 'files_deleted': report.files_deleted, 'bytes_freed': report.bytes_freed,
+                          'directories_deleted': report.directories_deleted, 'errors': len(report.errors)}))
+    else:
+        print("{verb} {files} files, {bytes} bytes and {directories} directories".format(
+            verb='Would delete' if report.dry_run else 'Deleted', files=report.files_deleted, bytes=report.bytes_freed,
+            directories=report.directories_deleted))
+    return 1 if report.errors else 0
+
 
-    found_files = do_scan(path, recursion_depth)
-    logger.debug("All files found before filter is applied: {files}".format(files=found_files))
-    return _filter_datetime_named_files(found_files, file_suffix, minimum_file_age, maximum_file_age, regexp)
+if __name__ == '__main__':
+    sys.exit(main())
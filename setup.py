@@ -10,10 +10,13 @@ setuptools.setup(
      long_description=long_description,
    long_description_content_type="text/markdown",
      url="https://github.com/Pixxle/fileutility",
-     packages=['fileutility'],
+     py_modules=['fileutility'],
+     entry_points={
+         'console_scripts': ['fileutility = fileutility:main'],
+     },
      zip_safe=False,
      classifiers=[
-         "Programming Language :: Python :: 2",
+         "Programming Language :: Python :: 3",
          "License :: OSI Approved :: MIT License",
          "Operating System :: OS Independent",
      ],
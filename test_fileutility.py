@@ -1,12 +1,21 @@
 #!/usr/bin/env python
 # -*- coding: utf-8 -*-
 import unittest
+import asyncio
+import contextlib
+import gc
+import inspect
 import os
-from fileutility import find_datetime_named_files, find_files, delete_files
+from fileutility import _match_date, DirectoryIndex, FileSet, PathFilter, Stats, directory_usage, retention_plan, largest_files, oldest_files, async_delete_files, async_find_datetime_named_files, async_find_files, find_datetime_named_files, find_files, delete_files, iter_datetime_named_files, iter_files
 import datetime
+import fileutility
 import time
+import types
+from unittest import mock
 import shutil
+import tempfile
 import datetime
+import io
 import pdb
 """ test_fileutility.py
 Provides the basic test cases for fileutility.py
@@ -55,6 +64,12 @@ class TestFindFiles(unittest.TestCase):
         found_files = find_files('tests/')
         self.assertListEqual(sorted(found_files), sorted(test_files))
 
+    def test_find_suffix_with_directory(self):
+        found_files = find_files('tests/', file_suffix='subdir2/test3.txt')
+        self.assertListEqual(found_files, ['tests/subdir1/subdir2/test3.txt'])
+        found_files = find_datetime_named_files('tests/', file_suffix='subdir3/test4-2018-08-17.txt')
+        self.assertListEqual(found_files, ['tests/subdir3/test4-2018-08-17.txt'])
+
     def test_find_root(self):
         found_files = find_files('tests/', recursion_depth=0)
         comp_files = test_files[0:3]
@@ -72,7 +87,7 @@ class TestFindFiles(unittest.TestCase):
 
     def test_find_younger(self):
         found_files = find_files(path='tests/', maximum_file_age=datetime.datetime(2015,10,11))
-        comp_files = test_files
+        comp_files = list(test_files)
         comp_files.remove('tests/subdir1/subdir2/test3.txt')
         comp_files.remove('tests/test1.txt')
         self.assertListEqual(sorted(found_files),sorted(comp_files))
@@ -92,6 +107,41 @@ class TestFindFiles(unittest.TestCase):
         comp_files = ['tests/subdir1/subdir2/test4_2018_08_17.csv']
         self.assertListEqual(sorted(found_files), sorted(comp_files))
 
+    def test_find_older_younger_stat_calls(self):
+        with mock.patch('os.stat', wraps=os.stat) as stat:
+            find_files(path='tests/', minimum_file_age=datetime.datetime(2017,10,11), maximum_file_age=datetime.datetime(2015,10,9))
+        self.assertLessEqual(stat.call_count, len(test_files))
+
+    def test_find_suffix_stat_calls(self):
+        with mock.patch('os.stat', wraps=os.stat) as stat:
+            found_files = find_files(path='tests/', file_suffix='.tar.gz', maximum_file_age=datetime.datetime(2015,10,9))
+        self.assertLessEqual(stat.call_count, len(found_files))
+
+    def test_iter_files(self):
+        found_files = iter_files('tests/', file_suffix='.csv')
+        self.assertIsInstance(found_files, types.GeneratorType)
+        self.assertListEqual(sorted(found_files), sorted(find_files('tests/', file_suffix='.csv')))
+
+    def test_iter_files_first_result(self):
+        found_files = iter_files('tests/', recursion_depth=0)
+        self.assertIn(next(found_files), test_files[0:3])
+
+    def test_find_workers(self):
+        found_files = find_files('tests/', workers=4)
+        self.assertListEqual(found_files, find_files('tests/'))
+
+    def test_find_processes(self):
+        found_files = find_files('tests/', file_suffix='.txt', processes=2)
+        self.assertListEqual(found_files, find_files('tests/', file_suffix='.txt'))
+
+    def test_find_processes_depth(self):
+        found_files = find_files('tests/', recursion_depth=1, processes=2, ordered=False)
+        self.assertListEqual(sorted(found_files), sorted(test_files[0:10]))
+
+    def test_find_workers_unordered(self):
+        found_files = find_files('tests/', recursion_depth=1, workers=4, ordered=False)
+        self.assertListEqual(sorted(found_files), sorted(test_files[0:10]))
+
     def test_delete_files(self):
         found_files = find_files(path='tests/subdir1/subdir2/')
         delete_files(found_files)
@@ -104,6 +154,47 @@ class TestFindFiles(unittest.TestCase):
         with self.assertRaises(OSError):
             find_files(path='tests/subdir1/subdir2/')
 
+    def test_delete_files_report(self):
+        with open('tests/subdir1/subdir2/test3.txt', 'w') as _file:
+            _file.write('0123456789')
+        report = delete_files(find_files(path='tests/subdir1/subdir2/'))
+        self.assertEqual(report.files_deleted, 5)
+        self.assertEqual(report.bytes_freed, 10)
+        self.assertListEqual(report.errors, [])
+
+    def test_delete_files_dry_run(self):
+        found_files = find_files(path='tests/subdir1/')
+        report = delete_files(found_files, directory_delete=True, dry_run=True, root='tests/')
+        self.assertEqual(report.files_deleted, len(found_files))
+        self.assertEqual(report.directories_deleted, 2)
+        self.assertListEqual(find_files(path='tests/subdir1/'), found_files)
+
+    def test_delete_files_missing(self):
+        with self.assertRaises(OSError):
+            delete_files(['tests/missing.txt'])
+
+    def test_delete_files_continue_on_error(self):
+        report = delete_files(['tests/test1.txt', 'tests/missing.txt', 'tests/test1.csv'], continue_on_error=True)
+        self.assertEqual(report.files_deleted, 2)
+        self.assertEqual([x for x, _ in report.errors], ['tests/missing.txt'])
+        self.assertListEqual(find_files(path='tests/', recursion_depth=0), ['tests/test1.png'])
+
+    def test_delete_files_prune_to_root(self):
+        delete_files(find_files(path='tests/subdir1/'), directory_delete=True, root='tests/')
+        self.assertFalse(os.path.exists('tests/subdir1'))
+        self.assertTrue(os.path.isdir('tests/subdir3/subdir4'))
+
+    def test_delete_files_prune_keeps_root(self):
+        report = delete_files(find_files(path='tests/subdir3/'), directory_delete=True, root='tests/subdir3/')
+        self.assertEqual(report.directories_deleted, 1)
+        self.assertListEqual(os.listdir('tests/subdir3'), [])
+
+    def test_delete_files_workers(self):
+        found_files = find_files(path='tests/')
+        report = delete_files(iter_files(path='tests/'), workers=4)
+        self.assertEqual(report.files_deleted, len(found_files))
+        self.assertListEqual(find_files(path='tests/'), [])
+
 
 class TestFindDatetimeFiles(unittest.TestCase):
 
@@ -163,6 +254,24 @@ class TestFindDatetimeFiles(unittest.TestCase):
         comp_files = ['tests/subdir1/subdir2/test4.18Aug19.tar.gz', 'tests/subdir1/subdir2/test4.18Aug17.tar.gz']
         self.assertListEqual(sorted(found_files), sorted(comp_files))
 
+    def test_iter_datetime_named_files(self):
+        found_files = iter_datetime_named_files('tests/', file_suffix='.tar.gz')
+        self.assertIsInstance(found_files, types.GeneratorType)
+        comp_files = ['tests/subdir1/subdir2/test4.18Aug17.tar.gz','tests/subdir1/subdir2/test4.18Aug19.tar.gz']
+        self.assertListEqual(sorted(found_files), sorted(comp_files))
+
+    def test_find_workers(self):
+        found_files = find_datetime_named_files('tests/', file_suffix='.tar.gz', workers=2)
+        self.assertListEqual(found_files, find_datetime_named_files('tests/', file_suffix='.tar.gz'))
+
+    def test_find_processes(self):
+        found_files = find_datetime_named_files('tests/', minimum_file_age=datetime.datetime(2018,8,18), processes=2)
+        self.assertListEqual(found_files, find_datetime_named_files('tests/', minimum_file_age=datetime.datetime(2018,8,18)))
+
+    def test_find_processes_index(self):
+        with self.assertRaises(ValueError):
+            find_datetime_named_files('tests/', processes=2, index=DirectoryIndex(':memory:'))
+
     def test_find_regexp(self):
         found_files = find_datetime_named_files(path='tests/', regexp=r'([0-9]{4})-([0-9]{2})-([0-9]{2})')
         comp_files = ['tests/subdir3/test4-2018-08-17.txt']
@@ -178,5 +287,636 @@ class TestFindDatetimeFiles(unittest.TestCase):
         comp_files = ['tests/subdir1/test4-2018-August-17.txt', 'tests/subdir1/test4-2018Aug17.txt']
         self.assertListEqual(sorted(found_files), sorted(comp_files))
 
+archive_files = [
+    'tests/archive/2017/12/31/app-2017-12-31.log',
+    'tests/archive/2018/08/16/app-2018-08-16.log',
+    'tests/archive/2018/08/17/app-2018-08-17.log',
+    'tests/archive/2018/08/17/host1/app-2018-08-17.log',
+    'tests/archive/2018/08/18/app-2018-08-18.log',
+    'tests/archive/2018/09/01/app-2018-09-01.log',
+    # Misplaced on purpose, only found when its directory is not pruned.
+    'tests/archive/2016/01/01/app-2018-08-17.log',
+]
+
+
+class TestPruneDateDirectories(unittest.TestCase):
+
+    def setUp(self):
+        for _file in archive_files:
+            if not os.path.isdir(os.path.dirname(_file)):
+                os.makedirs(os.path.dirname(_file))
+            open(_file, 'a').close()
+
+    def tearDown(self):
+        shutil.rmtree('tests/')
+
+    def test_find_without_pruning(self):
+        found_files = find_datetime_named_files('tests/', minimum_file_age=datetime.datetime(2018,8,17,12), maximum_file_age=datetime.datetime(2018,8,17))
+        comp_files = ['tests/archive/2018/08/17/app-2018-08-17.log', 'tests/archive/2018/08/17/host1/app-2018-08-17.log', 'tests/archive/2016/01/01/app-2018-08-17.log']
+        self.assertListEqual(sorted(found_files), sorted(comp_files))
+
+    def test_find_pruned(self):
+        with mock.patch('fileutility._scan_directory', wraps=fileutility._scan_directory) as scan:
+            found_files = find_datetime_named_files('tests/', minimum_file_age=datetime.datetime(2018,8,17,12), maximum_file_age=datetime.datetime(2018,8,17), prune_directories=True)
+        comp_files = ['tests/archive/2018/08/17/app-2018-08-17.log', 'tests/archive/2018/08/17/host1/app-2018-08-17.log']
+        self.assertListEqual(sorted(found_files), sorted(comp_files))
+        scanned = sorted(x[0][0] for x in scan.call_args_list)
+        self.assertListEqual(scanned, ['tests/', 'tests/archive', 'tests/archive/2018', 'tests/archive/2018/08', 'tests/archive/2018/08/17', 'tests/archive/2018/08/17/host1'])
+
+    def test_find_pruned_open_range(self):
+        found_files = find_datetime_named_files('tests/', maximum_file_age=datetime.datetime(2018,8,18), prune_directories=True)
+        comp_files = ['tests/archive/2018/08/18/app-2018-08-18.log', 'tests/archive/2018/09/01/app-2018-09-01.log']
+        self.assertListEqual(sorted(found_files), sorted(comp_files))
+
+    def test_find_pruned_not_a_year(self):
+        os.makedirs('tests/builds/1024/08')
+        open('tests/builds/1024/08/app-2018-08-17.log', 'a').close()
+        found_files = find_datetime_named_files('tests/builds/', minimum_file_age=datetime.datetime(2018,8,17,12), maximum_file_age=datetime.datetime(2018,8,17), prune_directories=True)
+        self.assertListEqual(found_files, ['tests/builds/1024/08/app-2018-08-17.log'])
+
+    def test_find_pruned_directory_regexp(self):
+        os.makedirs('tests/archive/logs-2018-08')
+        open('tests/archive/logs-2018-08/app-2018-08-17.log', 'a').close()
+        os.makedirs('tests/archive/logs-2018-07')
+        open('tests/archive/logs-2018-07/app-2018-08-17.log', 'a').close()
+        found_files = find_datetime_named_files('tests/archive/', recursion_depth=1, minimum_file_age=datetime.datetime(2018,8,31), maximum_file_age=datetime.datetime(2018,8,1),
+                                                directory_regexp=r'logs-([0-9]{4})-([0-9]{2})$')
+        self.assertListEqual(found_files, ['tests/archive/logs-2018-08/app-2018-08-17.log'])
+
+    def test_find_pruned_directory_regexp_without_groups(self):
+        with self.assertRaises(ValueError):
+            find_datetime_named_files('tests/', maximum_file_age=datetime.datetime(2018,8,1), directory_regexp=r'(?:19|20)[0-9]{2}$')
+
+
+class TestDirectoryIndex(unittest.TestCase):
+
+    def setUp(self):
+        os.makedirs('tests/subdir1/subdir2')
+        os.makedirs('tests/subdir3/subdir4')
+
+        for _file in test_files:
+            open(_file, 'a').close()
+
+        self.database = tempfile.mkdtemp()
+        self.index = DirectoryIndex(os.path.join(self.database, 'index.db'))
+        # Everything in the tests is younger than the racy window, which would keep the index from trusting any listing.
+        self.index.racy_seconds = 0
+
+    def tearDown(self):
+        self.index.close()
+        shutil.rmtree(self.database)
+        shutil.rmtree('tests/')
+
+    def test_find_all(self):
+        self.assertListEqual(find_files('tests/', index=self.index), find_files('tests/'))
+        self.assertListEqual(find_files('tests/', index=self.index), find_files('tests/'))
+
+    def test_find_datetime_named(self):
+        comp_files = find_datetime_named_files('tests/', file_suffix='.txt')
+        find_datetime_named_files('tests/', index=self.index)
+        self.assertListEqual(find_datetime_named_files('tests/', file_suffix='.txt', index=self.index), comp_files)
+
+    def test_cached_sizes_and_mtimes(self):
+        os.makedirs('tests/empty')
+        with open('tests/subdir1/test2.txt', 'w') as f:
+            f.write('12345')
+        os.utime('tests/subdir1/test2.txt', ns=(1234567890123456789, 1234567890123456789))
+        comp_files = find_files('tests/', compact='stat')
+        find_files('tests/', index=self.index)
+        found_files = find_files('tests/', index=self.index, compact='stat')
+        self.assertListEqual(list(found_files), list(comp_files))
+        self.assertListEqual(list(found_files.sizes), list(comp_files.sizes))
+        self.assertListEqual(list(found_files.mtimes), list(comp_files.mtimes))
+
+    def test_old_database_format(self):
+        import sqlite3
+        self.index.close()
+        database = os.path.join(self.database, 'old.db')
+        with contextlib.closing(sqlite3.connect(database)) as connection:
+            connection.execute("CREATE TABLE directories (path TEXT PRIMARY KEY, mtime_ns INTEGER) WITHOUT ROWID")
+            connection.execute("INSERT INTO directories VALUES ('tests/', 0)")
+            connection.commit()
+        self.index = DirectoryIndex(database)
+        self.index.racy_seconds = 0
+        find_files('tests/', index=self.index)
+        self.assertListEqual(find_files('tests/', index=self.index), find_files('tests/'))
+
+    def test_changed_directory(self):
+        find_files('tests/', index=self.index)
+        open('tests/subdir3/subdir4/test5.txt', 'a').close()
+        shutil.rmtree('tests/subdir1/subdir2')
+        self.assertListEqual(find_files('tests/', index=self.index), find_files('tests/'))
+
+    def test_cached_listing_and_invalidate(self):
+        find_files('tests/', index=self.index)
+        mtime = os.stat('tests/subdir3').st_mtime_ns
+        open('tests/subdir3/test5.txt', 'a').close()
+        os.utime('tests/subdir3', ns=(mtime, mtime))
+        self.assertNotIn('tests/subdir3/test5.txt', find_files('tests/', index=self.index))
+        self.index.invalidate('tests/subdir3')
+        self.assertIn('tests/subdir3/test5.txt', find_files('tests/', index=self.index))
+
+        mtime = os.stat('tests/subdir1').st_mtime_ns
+        open('tests/subdir1/test5.txt', 'a').close()
+        os.utime('tests/subdir1', ns=(mtime, mtime))
+        self.assertNotIn('tests/subdir1/test5.txt', find_files('tests/', index=self.index))
+        self.index.invalidate('tests/subdir1/')
+        self.assertIn('tests/subdir1/test5.txt', find_files('tests/', index=self.index))
+
+
+class TestAsync(unittest.TestCase):
+
+    def setUp(self):
+        os.makedirs('tests/subdir1/subdir2')
+        os.makedirs('tests/subdir3/subdir4')
+
+        for _file in test_files:
+            open(_file, 'a').close()
+
+    def tearDown(self):
+        shutil.rmtree('tests/')
+
+    def collect(self, files):
+        async def collect():
+            return [x async for x in files]
+        return asyncio.run(collect())
+
+    def test_find_files(self):
+        found_files = self.collect(async_find_files('tests/', batch_size=2))
+        self.assertListEqual(found_files, find_files('tests/'))
+
+    def test_find_datetime_named_files(self):
+        found_files = self.collect(async_find_datetime_named_files('tests/', file_suffix='.tar.gz', semaphore=asyncio.Semaphore(1)))
+        self.assertListEqual(found_files, find_datetime_named_files('tests/', file_suffix='.tar.gz'))
+
+    def test_delete_files(self):
+        async def delete():
+            return await async_delete_files(async_find_files('tests/subdir1/'), directory_delete=True, root='tests/', concurrency=2)
+        report = asyncio.run(delete())
+        self.assertEqual(report.files_deleted, 9)
+        self.assertFalse(os.path.exists('tests/subdir1'))
+
+    def test_delete_files_no_concurrency(self):
+        async def delete():
+            return await asyncio.wait_for(async_delete_files(['tests/test1.txt', 'tests/test1.csv'], concurrency=0), 5)
+        self.assertEqual(asyncio.run(delete()).files_deleted, 2)
+        self.assertFalse(os.path.exists('tests/test1.txt'))
+
+    def test_delete_files_errors_retrieved(self):
+        # Every failed batch has its exception retrieved, asyncio reports the others through the exception handler otherwise.
+        async def delete():
+            unhandled = []
+            asyncio.get_running_loop().set_exception_handler(lambda loop, context: unhandled.append(context))
+            with mock.patch('fileutility._DELETE_BATCH_SIZE', 1), self.assertRaises(FileNotFoundError):
+                await async_delete_files(['tests/missing{n}.txt'.format(n=n) for n in range(8)], concurrency=4)
+            gc.collect()
+            await asyncio.sleep(0)
+            return unhandled
+        self.assertListEqual(asyncio.run(delete()), [])
+
+    def test_event_loop_lag(self):
+        # A ticker sleeping 1ms at a time measures how long the loop was blocked while the scans run.
+        async def measure():
+            lag = []
+            scanning = True
+
+            async def ticker():
+                while scanning:
+                    start = time.perf_counter()
+                    await asyncio.sleep(0.001)
+                    lag.append(time.perf_counter() - start - 0.001)
+
+            async def scan():
+                return [x async for x in async_find_files('tests/', batch_size=1)]
+
+            task = asyncio.ensure_future(ticker())
+            found = await asyncio.gather(*[scan() for _ in range(8)])
+            scanning = False
+            await task
+            return found, max(lag)
+
+        found, lag = asyncio.run(measure())
+        self.assertListEqual(found[0], find_files('tests/'))
+        self.assertLess(lag, 0.1)
+
+
+class TestCommandLine(unittest.TestCase):
+
+    def setUp(self):
+        os.makedirs('tests/subdir1/subdir2')
+        os.makedirs('tests/subdir3/subdir4')
+
+        for _file in test_files:
+            open(_file, 'a').close()
+
+    def tearDown(self):
+        shutil.rmtree('tests/')
+
+    def run_main(self, argv, stdin=b''):
+        stdout = io.TextIOWrapper(io.BytesIO())
+        with mock.patch('sys.stdout', stdout), mock.patch('sys.stdin', io.TextIOWrapper(io.BytesIO(stdin))):
+            status = fileutility.main(argv)
+            stdout.flush()
+        return status, stdout.buffer.getvalue()
+
+    def test_find_print0(self):
+        status, output = self.run_main(['find', 'tests/', '--suffix', '.txt', '-print0'])
+        self.assertEqual(status, 0)
+        self.assertListEqual(output.split(b'\0')[:-1], [os.fsencode(x) for x in find_files('tests/', file_suffix='.txt')])
+
+    def test_find_dated_json(self):
+        status, output = self.run_main(['find-dated', 'tests/', '--older-than', '2018-08-18', '--json'])
+        self.assertEqual(status, 0)
+        self.assertListEqual(output.decode().splitlines(), ['{{"path": "{path}"}}'.format(path=x) for x in find_datetime_named_files('tests/', minimum_file_age=datetime.datetime(2018,8,18))])
+
+    def test_find_exclude(self):
+        status, output = self.run_main(['find', 'tests/', '--include', '*.txt', '--exclude-dir', 'subdir1', '--exclude', 'test1.*'])
+        self.assertEqual(status, 0)
+        self.assertListEqual(sorted(output.decode().splitlines()), ['tests/subdir3/subdir4/test3.txt', 'tests/subdir3/test2.txt', 'tests/subdir3/test4-2018-08-17.txt'])
+
+    def test_find_invalid_pattern(self):
+        for argv in [['find', 'tests/', '--exclude', '[z-a]'], ['find-dated', 'tests/', '--regexp', '(']]:
+            with mock.patch('sys.stderr', io.StringIO()) as stderr:
+                status, output = self.run_main(argv)
+            self.assertEqual(status, 1)
+            self.assertIn('fileutility: ', stderr.getvalue())
+
+    def test_find_dated_regexp_without_groups(self):
+        for argv in [['find-dated', 'tests/', '--regexp', 'a-'], ['find-dated', 'tests/', '--older-than', '2018-08-18', '--directory-regexp', r'20[0-9][0-9]$']]:
+            with mock.patch('sys.stderr', io.StringIO()) as stderr:
+                status, output = self.run_main(argv)
+            self.assertEqual(status, 1)
+            self.assertIn('groups', stderr.getvalue())
+
+    def test_find_missing(self):
+        with mock.patch('sys.stderr', io.StringIO()) as stderr:
+            status, output = self.run_main(['find', 'missing/'])
+        self.assertEqual(status, 1)
+        self.assertIn('missing/', stderr.getvalue())
+
+    def test_delete_stdin(self):
+        status, output = self.run_main(['delete', '-0'], stdin=b'tests/test1.txt\0tests/test1.csv\0')
+        self.assertEqual(status, 0)
+        self.assertEqual(output, b'Deleted 2 files, 0 bytes and 0 directories\n')
+        self.assertListEqual(sorted(find_files('tests/', recursion_depth=0)), ['tests/test1.png'])
+
+    def test_delete_dry_run(self):
+        status, output = self.run_main(['delete', '--dry-run', '--json', 'tests/test1.txt'])
+        self.assertEqual(status, 0)
+        self.assertIn(b'"files_deleted": 1', output)
+        self.assertTrue(os.path.exists('tests/test1.txt'))
+
+
+class TestFileSet(unittest.TestCase):
+
+    def setUp(self):
+        os.makedirs('tests/subdir1/subdir2')
+        os.makedirs('tests/subdir3/subdir4')
+
+        for n, _file in enumerate(test_files):
+            with open(_file, 'w') as f:
+                f.write('x' * n)
+
+        unixtime = time.mktime(datetime.date(2015,10,10).timetuple())
+        os.utime('tests/subdir1/subdir2/test3.txt', (unixtime, unixtime))
+
+    def tearDown(self):
+        shutil.rmtree('tests/')
+
+    def test_find_compact(self):
+        found_files = find_files('tests/', compact=True)
+        self.assertIsInstance(found_files, FileSet)
+        self.assertEqual(len(found_files), len(test_files))
+        self.assertListEqual(list(found_files), find_files('tests/'))
+
+    def test_shared_parameter_order(self):
+        # The parameters of the find functions that the iter and async variants take as well come first and in the same order.
+        for variants in [(find_files, iter_files, async_find_files), (find_datetime_named_files, iter_datetime_named_files, async_find_datetime_named_files)]:
+            parameters = [list(inspect.signature(x).parameters) for x in variants]
+            shared = [x for x in parameters[0] if all(x in y for y in parameters)]
+            for names in parameters:
+                self.assertListEqual(names[:len(shared)], shared)
+
+    def test_find_compact_stat(self):
+        stats = Stats()
+        found_files = find_files('tests/', compact='stat', stats=stats)
+        self.assertListEqual(list(found_files), find_files('tests/'))
+        self.assertEqual(stats.stat_calls, len(test_files))
+        self.assertListEqual([found_files.sizes[n] for n in range(len(found_files))], [test_files.index(x) for x in found_files])
+        entries = list(fileutility._iter_entries('tests/', None, -1, None, None, None, None, None, True, None, stat=True))
+        with mock.patch('os.stat', side_effect=AssertionError("stat'ed again")):
+            self.assertListEqual(list(FileSet._from_entries(entries).sizes), list(found_files.sizes))
+        self.assertListEqual(list(find_files('tests/', compact='stat', processes=2).sizes), list(found_files.sizes))
+
+    def test_find_datetime_compact(self):
+        found_files = find_datetime_named_files('tests/', file_suffix='.txt', compact=True)
+        self.assertListEqual(list(found_files), find_datetime_named_files('tests/', file_suffix='.txt'))
+
+    def test_index_and_slice(self):
+        found_files = find_files('tests/')
+        file_set = FileSet(found_files)
+        self.assertEqual(file_set[0], found_files[0])
+        self.assertEqual(file_set[-1], found_files[-1])
+        self.assertListEqual(list(file_set[2:9:3]), found_files[2:9:3])
+        with self.assertRaises(IndexError):
+            file_set[len(found_files)]
+
+    def test_sort(self):
+        file_set = FileSet(find_files('tests/'), stat=True)
+        file_set.sort('size', reverse=True)
+        self.assertListEqual(list(file_set), list(reversed(test_files)))
+        self.assertListEqual(list(file_set.sizes), list(reversed(range(len(test_files)))))
+        file_set.sort()
+        self.assertListEqual(list(file_set), sorted(test_files, key=lambda x: (os.path.dirname(x), os.path.basename(x))))
+
+    def test_filter(self):
+        file_set = FileSet(find_files('tests/'), stat=True)
+        self.assertListEqual(sorted(file_set.filter(minimum_file_size=3, maximum_file_size=5)), sorted(test_files[3:6]))
+        self.assertListEqual(list(file_set.filter(minimum_file_age=datetime.datetime(2015,10,11))), ['tests/subdir1/subdir2/test3.txt'])
+
+    def test_filter_without_stat(self):
+        with self.assertRaises(ValueError):
+            FileSet(find_files('tests/')).filter(minimum_file_size=1)
+
+
+class TestUsage(unittest.TestCase):
+
+    def setUp(self):
+        os.makedirs('tests/subdir1/subdir2')
+        os.makedirs('tests/subdir3/subdir4')
+
+        for n, _file in enumerate(test_files):
+            with open(_file, 'w') as f:
+                f.write('x' * n)
+
+        unixtime = time.mktime(datetime.date(2015,10,10).timetuple())
+        unixtime2 = time.mktime(datetime.date(2017,10,10).timetuple())
+        os.utime('tests/subdir1/subdir2/test3.txt', (unixtime, unixtime))
+        os.utime('tests/test1.txt', (unixtime2, unixtime2))
+
+    def tearDown(self):
+        shutil.rmtree('tests/')
+
+    def test_find_size(self):
+        found_files = find_files('tests/', minimum_file_size=3, maximum_file_size=5)
+        self.assertListEqual(sorted(found_files), sorted(test_files[3:6]))
+
+    def test_find_size_type(self):
+        with self.assertRaises(TypeError):
+            find_files('tests/', minimum_file_size='3')
+
+    def test_directory_usage(self):
+        usage = directory_usage('tests/')
+        self.assertEqual(usage['tests'].files, len(test_files))
+        self.assertEqual(usage['tests'].bytes, sum(range(len(test_files))))
+        subdir1 = [n for n, x in enumerate(test_files) if x.startswith('tests/subdir1/')]
+        self.assertEqual(usage['tests/subdir1'].files, len(subdir1))
+        self.assertEqual(usage['tests/subdir1'].bytes, sum(subdir1))
+        self.assertEqual(usage['tests/subdir1/subdir2'].bytes, sum(n for n, x in enumerate(test_files) if x.startswith('tests/subdir1/subdir2/')))
+
+    def test_directory_usage_filtered(self):
+        usage = directory_usage('tests/', file_suffix='.tar.gz')
+        self.assertListEqual(sorted(usage), ['tests', 'tests/subdir1', 'tests/subdir1/subdir2'])
+        self.assertEqual(usage['tests'].bytes, 15 + 16)
+
+    def test_largest_files(self):
+        self.assertListEqual(largest_files('tests/', 3), [(test_files[16], 16), (test_files[15], 15), (test_files[14], 14)])
+        self.assertListEqual(largest_files('tests/', 2, file_suffix='.txt'), [(test_files[12], 12), (test_files[10], 10)])
+
+    def test_oldest_files(self):
+        oldest = oldest_files('tests/', 2)
+        self.assertListEqual([x for x, y in oldest], ['tests/subdir1/subdir2/test3.txt', 'tests/test1.txt'])
+        self.assertEqual(oldest[0][1], datetime.datetime(2015,10,10))
+
+
+class TestRetentionPlan(unittest.TestCase):
+
+    def setUp(self):
+        # A backup a day from 2018-01-01 up to and including Monday 2019-02-04.
+        start = datetime.date(2018,1,1)
+        self.backups = ['backups/db-{date:%Y-%m-%d}.sql.gz'.format(date=start + datetime.timedelta(days=n)) for n in range(400)]
+
+    def test_keep_last(self):
+        plan = retention_plan(self.backups, keep_last=3)
+        self.assertListEqual(plan.keep, self.backups[:-4:-1])
+        self.assertListEqual(plan.delete, self.backups[-4::-1])
+
+    def test_keep_daily_weekly_monthly(self):
+        plan = retention_plan(self.backups, keep_daily=7, keep_weekly=4, keep_monthly=12)
+        daily = ['backups/db-2019-02-{day:02d}.sql.gz'.format(day=x) for x in (4, 3, 2, 1)] + ['backups/db-2019-01-{day}.sql.gz'.format(day=x) for x in (31, 30, 29)]
+        weekly = ['backups/db-2019-01-27.sql.gz', 'backups/db-2019-01-20.sql.gz']
+        monthly = ['backups/db-2018-{date}.sql.gz'.format(date=x) for x in ('12-31', '11-30', '10-31', '09-30', '08-31', '07-31', '06-30', '05-31', '04-30', '03-31')]
+        self.assertListEqual(plan.keep, daily + weekly + monthly)
+        self.assertEqual(len(plan.keep) + len(plan.delete), len(self.backups))
+        self.assertFalse(set(plan.keep) & set(plan.delete))
+
+    def test_keep_yearly(self):
+        plan = retention_plan(self.backups, keep_yearly=5)
+        self.assertListEqual(plan.keep, ['backups/db-2019-02-04.sql.gz', 'backups/db-2018-12-31.sql.gz'])
+
+    def test_undated(self):
+        plan = retention_plan(self.backups + ['backups/README'], keep_last=1)
+        self.assertListEqual(plan.undated, ['backups/README'])
+        self.assertNotIn('backups/README', plan.delete)
+
+    def test_regexp(self):
+        plan = retention_plan(['backups/db@18@aug@17', 'backups/db@18@aug@19'], keep_last=1, regexp=r'([0-9]{2})\@([a-z]{3})\@([0-9]{2})')
+        self.assertListEqual(plan.keep, ['backups/db@18@aug@19'])
+        self.assertListEqual(plan.delete, ['backups/db@18@aug@17'])
+        with self.assertRaises(ValueError):
+            retention_plan(self.backups, keep_last=1, regexp=r'([0-9]{4})-([0-9]{2})')
+
+    def test_type(self):
+        with self.assertRaises(TypeError):
+            retention_plan(self.backups, keep_daily='7')
+
+
+class TestStats(unittest.TestCase):
+
+    def setUp(self):
+        os.makedirs('tests/subdir1/subdir2')
+        os.makedirs('tests/subdir3/subdir4')
+
+        for _file in test_files:
+            with open(_file, 'w') as f:
+                f.write('data')
+
+    def tearDown(self):
+        shutil.rmtree('tests/')
+
+    def test_find_files(self):
+        stats = Stats()
+        found_files = find_files('tests/', file_suffix='.csv', minimum_file_age=datetime.datetime.now() + datetime.timedelta(days=1), stats=stats)
+        self.assertEqual(stats.directories_visited, 5)
+        self.assertEqual(stats.entries_seen, len(test_files) + 4)
+        self.assertEqual(stats.stat_calls, len(found_files))
+        self.assertEqual(stats.files_matched, len(found_files))
+        self.assertGreater(stats.traversal_seconds, 0)
+        self.assertGreater(stats.filter_seconds, 0)
+
+    def test_find_datetime_named_files(self):
+        stats = Stats()
+        found_files = find_datetime_named_files('tests/', workers=2, stats=stats)
+        self.assertEqual(stats.directories_visited, 5)
+        self.assertEqual(stats.files_matched, len(found_files))
+        self.assertGreaterEqual(stats.regex_evaluations, len(test_files))
+        self.assertEqual(stats.stat_calls, 0)
+
+    def test_shared_by_concurrent_scans(self):
+        alone = Stats()
+        find_datetime_named_files('tests/', stats=alone)
+
+        async def scan(stats):
+            return [x async for x in async_find_datetime_named_files('tests/', batch_size=1, stats=stats)]
+
+        async def scans(stats):
+            return await asyncio.gather(*[scan(stats) for _ in range(8)])
+        stats = Stats()
+        with mock.patch('fileutility._MERGE_FILES', 1):
+            asyncio.run(scans(stats))
+        for name in ('directories_visited', 'entries_seen', 'regex_evaluations', 'files_matched'):
+            self.assertEqual(getattr(stats, name), getattr(alone, name) * 8, name)
+
+    def test_merged_when_closed_early(self):
+        stats = Stats()
+        files = iter_files('tests/', stats=stats)
+        next(files)
+        files.close()
+        self.assertEqual(stats.files_matched, 1)
+
+    def test_index(self):
+        with DirectoryIndex(':memory:') as index:
+            index.racy_seconds = 0
+            find_files('tests/', index=index)
+            stats = Stats()
+            find_files('tests/', index=index, stats=stats)
+        self.assertEqual(stats.directories_visited, 5)
+        self.assertEqual(stats.directories_cached, 5)
+
+    def test_delete_files(self):
+        stats = Stats()
+        delete_files(iter_files('tests/subdir3/', stats=stats), directory_delete=True, root='tests/subdir3', stats=stats)
+        self.assertEqual(stats.files_matched, 5)
+        self.assertEqual(stats.files_deleted, 5)
+        self.assertEqual(stats.bytes_deleted, 20)
+        self.assertEqual(stats.directories_deleted, 1)
+        self.assertEqual(stats.delete_errors, 0)
+        self.assertGreater(stats.delete_seconds, 0)
+
+    def test_delete_files_dry_run(self):
+        stats = Stats()
+        report = delete_files(['tests/test1.txt', 'tests/missing.txt'], dry_run=True, continue_on_error=True, stats=stats)
+        self.assertEqual(report.files_deleted, 1)
+        self.assertEqual(stats.files_deleted, 0)
+        self.assertEqual(stats.bytes_deleted, 0)
+        self.assertEqual(stats.delete_errors, 1)
+        stats = Stats()
+        asyncio.run(async_delete_files(['tests/test1.txt'], dry_run=True, stats=stats))
+        self.assertEqual(stats.files_deleted, 0)
+        self.assertTrue(os.path.exists('tests/test1.txt'))
+
+    def test_as_dict(self):
+        stats = Stats()
+        find_files('tests/', recursion_depth=0, stats=stats)
+        self.assertEqual(stats.as_dict()['directories_visited'], 1)
+        self.assertEqual(stats.as_dict()['files_matched'], 3)
+
+    def test_processes(self):
+        with self.assertRaises(ValueError):
+            find_files('tests/', processes=2, stats=Stats())
+
+    def test_debug_formatting_skipped(self):
+        class Unprintable(list):
+            def __str__(self):
+                raise AssertionError("formatted with debug logging off")
+            __repr__ = __str__
+        report = delete_files(Unprintable(['tests/test1.txt']))
+        self.assertEqual(report.files_deleted, 1)
+
+    def test_debug_directory_messages_skipped(self):
+        # The messages logged per directory are only built with debug logging on, none of them reaches logger.debug here.
+        index = DirectoryIndex(':memory:')
+        with mock.patch.object(fileutility.logger, 'debug') as debug:
+            find_files('tests/', index=index, path_filter=PathFilter(exclude_directories=['subdir2']))
+            find_datetime_named_files('tests/', maximum_file_age=datetime.datetime(2018,8,18), prune_directories=True)
+            delete_files(find_files('tests/subdir3/'), directory_delete=True, root='tests/')
+        self.assertListEqual([x for x in debug.call_args_list if 'tests/' in str(x)], [])
+        index.close()
+
+
+class TestPathFilter(unittest.TestCase):
+
+    def setUp(self):
+        os.makedirs('tests/subdir1/subdir2')
+        os.makedirs('tests/subdir3/subdir4')
+
+        for _file in test_files:
+            open(_file, 'a').close()
+
+    def tearDown(self):
+        shutil.rmtree('tests/')
+
+    def test_include(self):
+        found_files = find_files('tests/', path_filter=PathFilter(include=['*.txt', '*.gz']))
+        self.assertListEqual(sorted(found_files), sorted(x for x in test_files if x.endswith(('.txt', '.gz'))))
+
+    def test_exclude_path(self):
+        found_files = find_files('tests/', path_filter=PathFilter(exclude=['test1.*', 'subdir1/**/*.csv']))
+        self.assertListEqual(sorted(found_files), sorted(x for x in test_files if not x.startswith('tests/test1.') and
+                                                         not (x.startswith('tests/subdir1/') and x.endswith('.csv'))))
+
+    def test_exclude_directories(self):
+        stats = Stats()
+        found_files = find_files('tests/', path_filter=PathFilter(exclude_directories=['subdir2', '/subdir3']), stats=stats)
+        self.assertListEqual(sorted(found_files), sorted(x for x in test_files if '/subdir2/' not in x and not x.startswith('tests/subdir3/')))
+        self.assertEqual(stats.directories_visited, 2)
+
+    def test_gitignore(self):
+        with open('tests/.gitignore', 'w') as f:
+            f.write('# build output\n*.csv\n!test1.csv\nsubdir4/\n/subdir1/subdir2\n.gitignore\n')
+        found_files = find_files('tests/', path_filter=PathFilter.from_gitignore('tests/.gitignore'))
+        self.assertListEqual(sorted(found_files), sorted(x for x in test_files if (not x.endswith('.csv') or x == 'tests/test1.csv') and
+                                                         '/subdir4/' not in x and '/subdir2/' not in x))
+
+    def test_gitignore_directory_only(self):
+        os.makedirs('tests/test1.txt.d')
+        open('tests/test1.txt.d/test5.txt', 'a').close()
+        found_files = find_files('tests/', recursion_depth=0, path_filter=PathFilter(exclude=['test1.*/'], gitignore=True))
+        self.assertIn('tests/test1.txt', found_files)
+        self.assertNotIn('tests/test1.txt.d/test5.txt', find_files('tests/', path_filter=PathFilter(exclude=['test1.*/'], gitignore=True)))
+
+    def test_datetime_named_files(self):
+        found_files = find_datetime_named_files('tests/', workers=2, path_filter=PathFilter(exclude_directories=['subdir2']))
+        self.assertListEqual(sorted(found_files), sorted(x for x in find_datetime_named_files('tests/') if '/subdir2/' not in x))
+
+    def test_processes(self):
+        path_filter = PathFilter(exclude=['/subdir3/*.txt'], exclude_directories=['subdir2'])
+        self.assertListEqual(find_files('tests/', processes=2, path_filter=path_filter), find_files('tests/', path_filter=path_filter))
+
+    def test_character_class(self):
+        open('tests/[!].txt', 'a').close()
+        found_files = find_files('tests/', recursion_depth=0, path_filter=PathFilter(exclude=['[!]*', 'test1.[ct]*']))
+        self.assertListEqual(found_files, ['tests/test1.png'])
+        with self.assertRaises(ValueError):
+            PathFilter(exclude=['[z-a]'])
+
+    def test_type(self):
+        with self.assertRaises(TypeError):
+            PathFilter(include=[1])
+        with self.assertRaises(TypeError):
+            find_files('tests/', path_filter=['*.txt'])
+
+
+class TestMatchDate(unittest.TestCase):
+
+    def test_month_names(self):
+        self.assertEqual(_match_date('db-2018-December-24.sql'), datetime.datetime(2018,12,24))
+        self.assertEqual(_match_date('db-2018may02.sql'), datetime.datetime(2018,5,2))
+        self.assertEqual(_match_date('db.18Sep03.sql'), datetime.datetime(2018,9,3))
+
+    def test_no_date(self):
+        self.assertIsNone(_match_date('notes.txt'))
+        self.assertIsNone(_match_date('core.1'))
+
 if __name__ == '__main__':
     unittest.main()
\ No newline at end of file